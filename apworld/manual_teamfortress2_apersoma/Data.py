@@ -1,13 +1,21 @@
+import hashlib
 import logging
+import os
+import pickle
+import pkgutil
 
-from .DataValidation import DataValidation, ValidationError
+import Utils
+
+from .DataValidation import DataValidation
 from .Helpers import load_data_file as helpers_load_data_file
 
+from . import hooks
 from .hooks.Data import \
     after_load_game_file, \
     after_load_item_file, after_load_location_file, \
     after_load_region_file, after_load_category_file, \
-    after_load_option_file, after_load_meta_file
+    after_load_option_file, after_load_meta_file, \
+    use_data_snapshot
 
 # blatantly copied from the minecraft ap world because why not
 def load_data_file(*args) -> dict:
@@ -36,51 +44,144 @@ class ManualFile:
         return contents
 
 
-game_table = ManualFile('game.json', dict).load() #dict
-item_table = convert_to_list(ManualFile('items.json', list).load(), 'data') #list
-location_table = convert_to_list(ManualFile('locations.json', list).load(), 'data') #list
-region_table = ManualFile('regions.json', dict).load() #dict
-category_table = ManualFile('categories.json', dict).load() #dict
-option_table = ManualFile('options.json', dict).load() #dict
-meta_table = ManualFile('meta.json', dict).load() #dict
-
-# Removal of schemas in root of tables
-region_table.pop('$schema', '')
-category_table.pop('$schema', '')
-
-# hooks
-game_table = after_load_game_file(game_table)
-item_table = after_load_item_file(item_table)
-location_table = after_load_location_file(location_table)
-region_table = after_load_region_file(region_table)
-category_table = after_load_category_file(category_table)
-option_table = after_load_option_file(option_table)
-meta_table = after_load_meta_file(meta_table)
+######################
+# Data snapshot
+######################
+
+data_files = ['game.json', 'items.json', 'locations.json', 'regions.json', 'categories.json', 'options.json', 'meta.json']
+snapshot_tables = ['game_table', 'item_table', 'location_table', 'region_table', 'category_table', 'option_table', 'meta_table']
+
+data_hash: str|None = None
+
+def get_data_hash() -> str|None:
+    """The hash of the data files and of the code that loads and checks them, None if one of those files couldn't be read"""
+    global data_hash
+    if data_hash is not None:
+        return data_hash
+    digest = hashlib.sha256()
+    sources = [f"data/{filename}" for filename in data_files] + \
+        ["Data.py", "Helpers.py", "DataValidation.py", "RegionGraph.py", "Game.py", "Items.py", "Locations.py", "Regions.py"] + \
+        [f"hooks/{module.name}.py" for module in sorted(pkgutil.iter_modules(hooks.__path__), key=lambda module: module.name)]
+    try:
+        for source in sources:
+            digest.update(source.encode())
+            digest.update(pkgutil.get_data(__name__, source) or b"")
+    except OSError:
+        return None
+    data_hash = digest.hexdigest()[:32]
+    return data_hash
+
+def get_data_cache_path(extension: str) -> str|None:
+    """The file in Archipelago's cache folder for the current data, with the given extension"""
+    current_hash = get_data_hash()
+    if current_hash is None:
+        return None
+    return Utils.cache_path("manual", f"{__package__.split('.')[-1]}_{current_hash}.{extension}")
+
+def get_data_snapshot_path() -> str|None:
+    """The cache file of the tables for the current data, None if it can't be hashed"""
+    return get_data_cache_path("pickle")
+
+def load_data_snapshot(path: str) -> dict|None:
+    try:
+        with open(path, "rb") as snapshot_file:
+            snapshot = pickle.load(snapshot_file)
+    except Exception: # missing or unreadable, load the data files instead
+        return None
+    if not isinstance(snapshot, dict) or any(table not in snapshot for table in snapshot_tables):
+        return None
+    return snapshot
+
+def save_data_snapshot(path: str, snapshot: dict):
+    folder, filename = os.path.split(path)
+    prefix = filename.rsplit("_", 1)[0] + "_"
+    current = filename.rsplit(".", 1)[0] + "."
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for old_file in os.listdir(folder): # only the files for the current data are worth keeping
+            if old_file.startswith(prefix) and not old_file.startswith(current):
+                os.remove(os.path.join(folder, old_file))
+        with open(temp_path, "wb") as snapshot_file:
+            pickle.dump(snapshot, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except Exception as e: # the snapshot is only a cache, eg. an after_load hook returning something that can't be pickled shouldn't stop the import
+        logging.debug(f"Could not save the data snapshot of {__package__} to {path}: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+def has_validation_passed() -> bool:
+    """Whether the generation validation already passed for the current data, in this process or an earlier one"""
+    path = get_data_cache_path("validated") if use_data_snapshot else None
+    return path is not None and os.path.exists(path)
+
+def mark_validation_passed():
+    path = get_data_cache_path("validated") if use_data_snapshot else None
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w"):
+            pass
+    except OSError as e:
+        logging.debug(f"Could not save the validation marker of {__package__} to {path}: {e}")
+
+def load_data_tables() -> dict:
+    """Load every data file and run its after_load hook"""
+    game_table = ManualFile('game.json', dict).load() #dict
+    item_table = convert_to_list(ManualFile('items.json', list).load(), 'data') #list
+    location_table = convert_to_list(ManualFile('locations.json', list).load(), 'data') #list
+    region_table = ManualFile('regions.json', dict).load() #dict
+    category_table = ManualFile('categories.json', dict).load() #dict
+    option_table = ManualFile('options.json', dict).load() #dict
+    meta_table = ManualFile('meta.json', dict).load() #dict
+
+    # Removal of schemas in root of tables
+    region_table.pop('$schema', '')
+    category_table.pop('$schema', '')
+
+    # hooks
+    return {
+        'game_table': after_load_game_file(game_table),
+        'item_table': after_load_item_file(item_table),
+        'location_table': after_load_location_file(location_table),
+        'region_table': after_load_region_file(region_table),
+        'category_table': after_load_category_file(category_table),
+        'option_table': after_load_option_file(option_table),
+        'meta_table': after_load_meta_file(meta_table),
+    }
+
+######################
+# Tables
+######################
+
+def get_data_tables() -> dict:
+    """Load the tables, from the snapshot if there's a valid one"""
+    snapshot_path = get_data_snapshot_path() if use_data_snapshot else None
+    loaded = load_data_snapshot(snapshot_path) if snapshot_path else None
+    if loaded is None:
+        loaded = load_data_tables()
+        # an empty table means invalid json, stage_assert_generate reports it in full and it shouldn't be cached
+        empty_files = [filename for filename, table in [('game.json', 'game_table'), ('items.json', 'item_table'), ('locations.json', 'location_table')] if not loaded[table]]
+        if empty_files:
+            logging.error(f"Nothing was found in {', '.join(empty_files)} of {__package__}, this likely indicates that the JSON is incorrectly formatted.")
+        elif snapshot_path:
+            save_data_snapshot(snapshot_path, loaded)
+    return loaded
+
+tables = get_data_tables()
+game_table = tables['game_table'] #dict
+item_table = tables['item_table'] #list
+location_table = tables['location_table'] #list
+region_table = tables['region_table'] #dict
+category_table = tables['category_table'] #dict
+option_table = tables['option_table'] #dict
+meta_table = tables['meta_table'] #dict
 
 # seed all of the tables for validation
 DataValidation.game_table = game_table
 DataValidation.item_table = item_table
 DataValidation.location_table = location_table
 DataValidation.region_table = region_table
-
-validation_errors = []
-
-# check that json files are not just invalid json
-try: DataValidation.checkForGameBeingInvalidJSON()
-except ValidationError as e: validation_errors.append(e)
-
-try: DataValidation.checkForItemsBeingInvalidJSON()
-except ValidationError as e: validation_errors.append(e)
-
-try: DataValidation.checkForLocationsBeingInvalidJSON()
-except ValidationError as e: validation_errors.append(e)
-
-
-############
-# If there are any validation errors, display all of them at once
-############
-
-if len(validation_errors) > 0:
-    logging.error("\nValidationError(s): \n\n%s\n\n" % ("\n".join([' - ' + str(validation_error) for validation_error in validation_errors])))
-    print("\n\nYou can close this window.\n")
-    keeping_terminal_open = input("If you are running from a terminal, press Ctrl-C followed by ENTER to break execution.")
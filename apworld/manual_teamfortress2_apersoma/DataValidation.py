@@ -1,8 +1,10 @@
 import logging
 import re
 import json
+from collections import Counter
 from worlds.AutoWorld import World
 from BaseClasses import MultiWorld, ItemClassification
+from .RegionGraph import RegionGraph
 
 
 class ValidationError(Exception):
@@ -13,171 +15,123 @@ class DataValidation():
     item_table = []
     location_table = []
     region_table = {}
+    indexes = {}
+    indexes_key = None
 
 
     @staticmethod
-    def checkItemNamesInLocationRequires():
-        for location in DataValidation.location_table:
-            if "requires" not in location:
-                continue
-
-            if isinstance(location["requires"], str):
-                # parse user written statement into list of each item
-                for item in re.findall(r'\|[^|]+\|', location["requires"]):
-                    if item.lower() == "or" or item.lower() == "and" or item == ")" or item == "(":
-                        continue
-                    else:
-                        # if it's a category, validate that the category exists
-                        if '@' in item:
-                            item = item.replace("|", "")
-                            item_parts = item.split(":")
-                            item_name = item
-
-                            if len(item_parts) > 1:
-                                item_name = item_parts[0]
-
-                            item_name = item_name[1:]
-                            item_category_exists = len([item for item in DataValidation.item_table if item_name in item.get('category', [])]) > 0
-
-                            if not item_category_exists:
-                                raise ValidationError("Item category %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
-
-                            continue
-
-                        item = item.replace("|", "")
-
-                        item_parts = item.split(":")
-                        item_name = item
-
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
-
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
-
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
+    def getRequiresReferences(requires) -> list[tuple[bool, str]]:
+        """Returns the (is a category, name) of every item and category a requires mentions, in order"""
+        references = []
+        if isinstance(requires, str):
+            # parse user written statement into list of each item
+            for item in re.findall(r'\|[^|]+\|', requires):
+                # if it's a category, validate that the category exists
+                if '@' in item:
+                    item_name = item.replace("|", "").split(":")[0]
+                    references.append((True, item_name[1:]))
+                    continue
 
-            else:  # item access is in dict form
-                for item in location["requires"]:
-                    # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
-                    if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                        or_items = item
+                references.append((False, item.replace("|", "").split(":")[0]))
 
-                        if isinstance(item, dict):
-                            or_items = item["or"]
+        else:  # item access is in dict form
+            for item in requires:
+                # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
+                if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
+                    or_items = item
 
-                        for or_item in or_items:
-                            or_item_parts = or_item.split(":")
-                            or_item_name = or_item
+                    if isinstance(item, dict):
+                        or_items = item["or"]
 
-                            if len(or_item_parts) > 1:
-                                or_item_name = or_item_parts[0]
+                    for or_item in or_items:
+                        references.append((False, or_item.split(":")[0]))
+                else:
+                    references.append((False, item.split(":")[0]))
 
-                            item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == or_item_name]) > 0
+        return references
 
-                            if not item_exists:
-                                raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (or_item_name, location["name"]))
-                    else:
-                        item_parts = item.split(":")
-                        item_name = item
+    @staticmethod
+    def getIndexes() -> dict:
+        """The names, categories and requires tokens of the tables, built once so the checks don't rescan the tables for every entry.
+        Rebuilt when one of the tables is replaced or changes size, or after clearIndexes()."""
+        key = tuple((id(table), len(table)) for table in [DataValidation.game_table, DataValidation.item_table, DataValidation.location_table, DataValidation.region_table])
+        if DataValidation.indexes_key == key:
+            return DataValidation.indexes
+
+        item_names = set()
+        item_categories = set()
+        for item in DataValidation.item_table:
+            item_names.add(item["name"])
+            categories = item.get("category", [])
+            item_categories.update([categories] if isinstance(categories, str) else categories)
+
+        # the first location/region whose requires use |Item Name| as is, which should make that item progression
+        requires_first_use = ({}, {})
+        for kind, areas in enumerate([[(location["name"], location) for location in DataValidation.location_table], DataValidation.region_table.items()]):
+            for area_name, area in areas:
+                if "requires" in area and isinstance(area["requires"], str):
+                    for token in re.findall(r'\|[^|]+\|', area["requires"]):
+                        requires_first_use[kind].setdefault(token[1:-1], area_name)
+
+        DataValidation.indexes = {
+            "item_names": item_names,
+            "item_categories": item_categories,
+            "region_names": set(DataValidation.region_table),
+            "region_graph": RegionGraph.from_region_table(DataValidation.region_table),
+            "location_requires_first_use": requires_first_use[0],
+            "region_requires_first_use": requires_first_use[1],
+        }
+        DataValidation.indexes_key = key
+        return DataValidation.indexes
 
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
+    @staticmethod
+    def clearIndexes():
+        DataValidation.indexes = {}
+        DataValidation.indexes_key = None
 
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
+    @staticmethod
+    def checkItemNamesInLocationRequires():
+        indexes = DataValidation.getIndexes()
+        for location in DataValidation.location_table:
+            if "requires" not in location:
+                continue
 
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
+            for is_category, item_name in DataValidation.getRequiresReferences(location["requires"]):
+                if is_category:
+                    if item_name not in indexes["item_categories"]:
+                        raise ValidationError("Item category %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
+                elif item_name not in indexes["item_names"]:
+                    raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
 
     @staticmethod
     def checkItemNamesInRegionRequires():
+        indexes = DataValidation.getIndexes()
         for region_name in DataValidation.region_table:
             region = DataValidation.region_table[region_name]
 
             if "requires" not in region:
                 continue
 
-            if isinstance(region["requires"], str):
-                # parse user written statement into list of each item
-                for item in re.findall(r'\|[^|]+\|', region["requires"]):
-                    if item.lower() == "or" or item.lower() == "and" or item == ")" or item == "(":
-                        continue
-                    else:
-                        # if it's a category, validate that the category exists
-                        if '@' in item:
-                            item = item.replace("|", "")
-                            item_parts = item.split(":")
-                            item_name = item
-
-                            if len(item_parts) > 1:
-                                item_name = item_parts[0]
-
-                            item_name = item_name[1:]
-                            item_category_exists = len([item for item in DataValidation.item_table if item_name in item.get('category', [])]) > 0
-
-                            if not item_category_exists:
-                                raise ValidationError("Item category %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
-
-                            continue
-
-                        item = item.replace("|", "")
-
-                        item_parts = item.split(":")
-                        item_name = item
-
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
-
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
-
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
-
-            else:  # item access is in dict form
-                for item in region["requires"]:
-                    # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
-                    if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                        or_items = item
-
-                        if isinstance(item, dict):
-                            or_items = item["or"]
-
-                        for or_item in or_items:
-                            or_item_parts = or_item.split(":")
-                            or_item_name = or_item
-
-                            if len(or_item_parts) > 1:
-                                or_item_name = or_item_parts[0]
-
-                            item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == or_item_name]) > 0
-
-                            if not item_exists:
-                                raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (or_item_name, region_name))
-                    else:
-                        item_parts = item.split(":")
-                        item_name = item
-
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
-
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
-
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
+            for is_category, item_name in DataValidation.getRequiresReferences(region["requires"]):
+                if is_category:
+                    if item_name not in indexes["item_categories"]:
+                        raise ValidationError("Item category %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
+                elif item_name not in indexes["item_names"]:
+                    raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
 
     @staticmethod
     def checkRegionNamesInLocations():
+        region_names = DataValidation.getIndexes()["region_names"]
         for location in DataValidation.location_table:
             if "region" not in location or location["region"] in ["Menu", "Manual"]:
                 continue
 
-            region_exists = len([name for name in DataValidation.region_table if name == location["region"]]) > 0
-
-            if not region_exists:
+            if location["region"] not in region_names:
                 raise ValidationError("Region %s is set for location %s, but the region is misspelled or does not exist." % (location["region"], location["name"]))
 
     @staticmethod
     def checkItemsThatShouldBeRequired():
+        indexes = DataValidation.getIndexes()
         for item in DataValidation.item_table:
             # if the item is already progression, no need to check
             if "progression" in item and item["progression"]:
@@ -188,38 +142,12 @@ class DataValidation():
                 continue
 
             # check location requires for the presence of item name
-            for location in DataValidation.location_table:
-                if "requires" not in location:
-                    continue
-
-                # convert to json so we don't have to guess the data type
-                location_requires = json.dumps(location["requires"])
-
-                # if boolean, else legacy
-                if isinstance(location_requires, str):
-                    if '|{}|'.format(item["name"]) in location_requires:
-                        raise ValidationError("Item %s is required by location %s, but the item is not marked as progression." % (item["name"], location["name"]))
-                else:
-                    if item["name"] in location_requires:
-                        raise ValidationError("Item %s is required by location %s, but the item is not marked as progression." % (item["name"], location["name"]))
+            if item["name"] in indexes["location_requires_first_use"]:
+                raise ValidationError("Item %s is required by location %s, but the item is not marked as progression." % (item["name"], indexes["location_requires_first_use"][item["name"]]))
 
             # check region requires for the presence of item name
-            for region_name in DataValidation.region_table:
-                region = DataValidation.region_table[region_name]
-
-                if "requires" not in region:
-                    continue
-
-                # convert to json so we don't have to guess the data type
-                region_requires = json.dumps(region["requires"])
-
-                # if boolean, else legacy
-                if isinstance(region_requires, str):
-                    if '|{}|'.format(item["name"]) in region_requires:
-                        raise ValidationError("Item %s is required by region %s, but the item is not marked as progression." % (item["name"], region_name))
-                else:
-                    if item["name"] in region_requires:
-                        raise ValidationError("Item %s is required by region %s, but the item is not marked as progression." % (item["name"], region_name))
+            if item["name"] in indexes["region_requires_first_use"]:
+                raise ValidationError("Item %s is required by region %s, but the item is not marked as progression." % (item["name"], indexes["region_requires_first_use"][item["name"]]))
 
     @staticmethod
     def _checkLocationRequiresForItemValueWithRegex(values_requested: dict[str, int], requires) -> dict[str, int]:
@@ -297,34 +225,29 @@ class DataValidation():
                 continue
 
             for connecting_region in region["connects_to"]:
-                region_exists = len([name for name in DataValidation.region_table if name == connecting_region]) > 0
-
-                if not region_exists:
+                if connecting_region not in DataValidation.region_table:
                     raise ValidationError("Region %s connects to a region %s, which is misspelled or does not exist." % (region_name, connecting_region))
 
     @staticmethod
     def checkForDuplicateItemNames():
+        name_counts = Counter(item["name"] for item in DataValidation.item_table)
         for item in DataValidation.item_table:
-            name_count = len([i for i in DataValidation.item_table if i["name"] == item["name"]])
-
-            if name_count > 1:
+            if name_counts[item["name"]] > 1:
                 raise ValidationError("Item %s is defined more than once." % (item["name"]))
 
     @staticmethod
     def checkForDuplicateLocationNames():
+        name_counts = Counter(location["name"] for location in DataValidation.location_table)
         for location in DataValidation.location_table:
-            name_count = len([l for l in DataValidation.location_table if l["name"] == location["name"]])
-
-            if name_count > 1:
+            if name_counts[location["name"]] > 1:
                 raise ValidationError("Location %s is defined more than once." % (location["name"]))
 
     @staticmethod
     def checkForDuplicateRegionNames():
         # this currently does nothing because the region name is a dict key, which will never be non-unique / limited to 1
+        name_counts = Counter(region_name for region_name in DataValidation.region_table)
         for region_name in DataValidation.region_table:
-            name_count = len([r for r in DataValidation.region_table if r == region_name])
-
-            if name_count > 1:
+            if name_counts[region_name] > 1:
                 raise ValidationError("Region %s is defined more than once." % (region_name))
 
     @staticmethod
@@ -333,6 +256,7 @@ class DataValidation():
             return
 
         starting_items = DataValidation.game_table["starting_items"]
+        indexes = DataValidation.getIndexes()
 
         for starting_block in starting_items:
             if "items" in starting_block and "item_categories" in starting_block:
@@ -340,12 +264,12 @@ class DataValidation():
 
             if "items" in starting_block:
                 for item_name in starting_block["items"]:
-                    if not item_name in [item["name"] for item in DataValidation.item_table]:
+                    if not item_name in indexes["item_names"]:
                         raise ValidationError("Item %s is set as a starting item, but is misspelled or is not defined." % (item_name))
 
             if "item_categories" in starting_block:
                 for category_name in starting_block["item_categories"]:
-                    if len([item for item in DataValidation.item_table if "category" in item and category_name in item["category"]]) == 0:
+                    if not category_name in indexes["item_categories"]:
                         raise ValidationError("Item category %s is set as a starting item category, but is misspelled or is not defined on any items." % (category_name))
 
     @staticmethod
@@ -380,6 +304,7 @@ class DataValidation():
 
     @staticmethod
     def checkPlacedItemsForValidItems():
+        item_names = DataValidation.getIndexes()["item_names"]
         for location in DataValidation.location_table:
             if not (place_item := location.get("place_item", False)):
                 continue
@@ -389,11 +314,12 @@ class DataValidation():
                 continue
 
             for item_name in place_item:
-                if not item_name in [item["name"] for item in DataValidation.item_table]:
+                if not item_name in item_names:
                     raise ValidationError("Item %s is placed (using place_item) on a location, but is misspelled or is not defined." % (item_name))
 
     @staticmethod
     def checkPlacedItemCategoriesForValidItemCategories():
+        item_categories = DataValidation.getIndexes()["item_categories"]
         for location in DataValidation.location_table:
             if not (place_item_category := location.get("place_item_category", False)):
                 continue
@@ -403,7 +329,7 @@ class DataValidation():
                 continue
 
             for category_name in place_item_category:
-                if len([item for item in DataValidation.item_table if "category" in item and category_name in item["category"]]) == 0:
+                if not category_name in item_categories:
                     raise ValidationError("Item category %s is placed (using place_item_category) on a location, but is misspelled or is not defined." % (category_name))
 
     @staticmethod
@@ -428,13 +354,15 @@ class DataValidation():
         if not using_starting_regions:
             return
 
-        nonstarting_regions = [region for region in DataValidation.region_table if not DataValidation.region_table[region].get("starting")]
+        starting_regions = [region for region in DataValidation.region_table if DataValidation.region_table[region].get("starting")]
+        region_graph = DataValidation.getIndexes()["region_graph"]
 
-        for nonstarter in nonstarting_regions:
-            regions_that_connect_to = [region for region in DataValidation.region_table if "connects_to" in DataValidation.region_table[region] and nonstarter in DataValidation.region_table[region]["connects_to"]]
+        # every region that can't be reached is either one of these groups or only reachable from them
+        for group in region_graph.unreachable_groups(starting_regions):
+            if len(group) == 1 and not region_graph.entrances[group[0]]:
+                raise ValidationError("The region '%s' is set as a non-starting region, but has no regions that connect to it. It will be inaccessible." % group[0])
 
-            if len(regions_that_connect_to) == 0:
-                raise ValidationError("The region '%s' is set as a non-starting region, but has no regions that connect to it. It will be inaccessible." % nonstarter)
+            raise ValidationError("The regions '%s' only connect to each other and no starting region leads to them. They will be inaccessible." % "', '".join(group))
 
 
 def runPreFillDataValidation(world: World, multiworld: MultiWorld):
@@ -451,7 +379,24 @@ def runPreFillDataValidation(world: World, multiworld: MultiWorld):
 
 # Called during stage_assert_generate
 def runGenerationDataValidation(cls) -> None:
+    from .Data import has_validation_passed, mark_validation_passed
+    # these checks only depend on the data, so they don't need to run again until it changes
+    if has_validation_passed():
+        return
+
     validation_errors = []
+    # hooks may have changed entries of the tables in place since the indexes were last built
+    DataValidation.clearIndexes()
+
+    # check that json files are not just invalid json
+    try: DataValidation.checkForGameBeingInvalidJSON()
+    except ValidationError as e: validation_errors.append(e)
+
+    try: DataValidation.checkForItemsBeingInvalidJSON()
+    except ValidationError as e: validation_errors.append(e)
+
+    try: DataValidation.checkForLocationsBeingInvalidJSON()
+    except ValidationError as e: validation_errors.append(e)
 
     # check that requires have correct item names in locations and regions
     try: DataValidation.checkItemNamesInLocationRequires()
@@ -509,3 +454,5 @@ def runGenerationDataValidation(cls) -> None:
         heading = f"ValidationError(s) in {cls.game}:";
 
         raise Exception("\n\n%s \n\n%s\n\n" % (heading, "\n".join([' - ' + str(validation_error) for validation_error in validation_errors])))
+
+    mark_validation_passed()
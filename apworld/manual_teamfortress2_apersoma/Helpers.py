@@ -4,12 +4,17 @@ import os
 import pkgutil
 import json
 
+from abc import abstractmethod
 from BaseClasses import MultiWorld, Item
+from Options import PerGameCommonOptions
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping
 from enum import IntEnum
-from typing import Optional, List, TYPE_CHECKING, Union, get_args, get_origin, Any
+from typing import Callable, Optional, List, TYPE_CHECKING, Union, get_args, get_origin, Any
 from types import GenericAlias
 from worlds.AutoWorld import World
 from .hooks.Helpers import before_is_category_enabled, before_is_item_enabled, before_is_location_enabled
+from .RegionGraph import RegionGraph
 
 if TYPE_CHECKING:
     from .Items import ManualItem
@@ -59,6 +64,10 @@ def clamp(value, min, max):
 def is_category_enabled(multiworld: MultiWorld, player: int, category_name: str) -> bool:
     from .Data import category_table
     """Check if a category has been disabled by a yaml option."""
+    enablement = get_enablement_table(multiworld, player)
+    if enablement is not None:
+        return enablement.is_category_enabled(category_name)
+
     hook_result = before_is_category_enabled(multiworld, player, category_name)
     if hook_result is not None:
         return hook_result
@@ -89,6 +98,10 @@ def is_item_name_enabled(multiworld: MultiWorld, player: int, item_name: str) ->
 
 def is_item_enabled(multiworld: MultiWorld, player: int, item: "ManualItem") -> bool:
     """Check if an item has been disabled by a yaml option."""
+    enablement = get_enablement_table(multiworld, player)
+    if enablement is not None:
+        return enablement.is_item_enabled(item)
+
     hook_result = before_is_item_enabled(multiworld, player, item)
     if hook_result is not None:
         return hook_result
@@ -105,6 +118,10 @@ def is_location_name_enabled(multiworld: MultiWorld, player: int, location_name:
 
 def is_location_enabled(multiworld: MultiWorld, player: int, location: "ManualLocation") -> bool:
     """Check if a location has been disabled by a yaml option."""
+    enablement = get_enablement_table(multiworld, player)
+    if enablement is not None:
+        return enablement.is_location_enabled(location)
+
     hook_result = before_is_location_enabled(multiworld, player, location)
     if hook_result is not None:
         return hook_result
@@ -123,19 +140,185 @@ def _is_manualobject_enabled(multiworld: MultiWorld, player: int, object: Any) -
 
     return enabled
 
+class EnablementTable:
+    """Whether the categories, items and locations are enabled for a player, each worked out the first time it's asked for.\n
+    Only made once the options are final, by ManualWorld.create_regions. The yaml_option part is shared by every player with the same values for those options.
+    """
+    def __init__(self, multiworld: MultiWorld, player: int):
+        from .Data import category_table
+        self.multiworld = multiworld
+        self.player = player
+        self.world = multiworld.worlds[player]
+
+        fingerprint = tuple(is_option_enabled(multiworld, player, option_name) for option_name in get_yaml_option_names())
+        if fingerprint not in category_yaml_enablement:
+            category_yaml_enablement[fingerprint] = {category_name: resolve_yaml_option(multiworld, player, category_data)
+                                                     for category_name, category_data in category_table.items()}
+        self.category_yaml = category_yaml_enablement[fingerprint]
+
+        self.categories: dict[str, bool] = {}
+        self.items: dict[str, bool] = {}
+        self.locations: dict[str, bool] = {}
+
+    def is_category_enabled(self, category_name: str) -> bool:
+        enabled = self.categories.get(category_name)
+        if enabled is None:
+            hook_result = before_is_category_enabled(self.multiworld, self.player, category_name)
+            enabled = self.category_yaml.get(category_name, True) if hook_result is None else hook_result
+            self.categories[category_name] = enabled
+        return enabled
+
+    def is_item_enabled(self, item: "ManualItem") -> bool:
+        return self._is_enabled(item, self.items, self.world.item_name_to_item, before_is_item_enabled)
+
+    def is_location_enabled(self, location: "ManualLocation") -> bool:
+        return self._is_enabled(location, self.locations, self.world.location_name_to_location, before_is_location_enabled)
+
+    def _is_enabled(self, object: Any, cache: dict[str, bool], definitions: dict, hook) -> bool:
+        # only the definitions themselves are remembered, a hook could be given a modified copy
+        cacheable = definitions.get(object.get("name")) is object
+        if cacheable and object["name"] in cache:
+            return cache[object["name"]]
+
+        enabled = hook(self.multiworld, self.player, object)
+        if enabled is None:
+            enabled = all(self.is_category_enabled(category) for category in object.get("category", []))
+
+        if cacheable:
+            cache[object["name"]] = enabled
+        return enabled
+
+# yaml_option values -> whether each category is enabled by its yaml_option
+category_yaml_enablement: dict[tuple[bool, ...], dict[str, bool]] = {}
+yaml_option_names: Optional[tuple[str, ...]] = None
+
+def get_yaml_option_names() -> tuple[str, ...]:
+    """The options used by the yaml_option of any category"""
+    global yaml_option_names
+    if yaml_option_names is None:
+        from .Data import category_table
+        yaml_option_names = tuple(sorted({format_to_valid_identifier(option_name[1:] if option_name.startswith("!") else option_name)
+                                          for category_data in category_table.values()
+                                          for option_name in category_data.get("yaml_option", [])}))
+    return yaml_option_names
+
+def get_enablement_table(multiworld: MultiWorld, player: int) -> Optional[EnablementTable]:
+    world = multiworld.worlds.get(player) if multiworld else None
+    return getattr(world, "enablement", None)
+
+def freeze_option_value(value: Any) -> Any:
+    """A hashable version of an option's value, equal for equal values"""
+    if isinstance(value, Mapping):
+        return tuple(sorted(((repr(key), freeze_option_value(item)) for key, item in value.items()), key=lambda pair: pair[0]))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((freeze_option_value(item) for item in value), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_option_value(item) for item in value)
+    return value
+
+def get_options_fingerprint(world: World) -> Optional[tuple]:
+    """The values of the game's own options, players with the same ones get the same enabled items and locations.\n
+    None if world.share_between_players is False. Only use it once the options are final, from create_regions on."""
+    if not getattr(world, "share_between_players", False):
+        return None
+
+    fingerprint = getattr(world, "options_fingerprint", None)
+    if fingerprint is None:
+        common_options = PerGameCommonOptions.type_hints
+        fingerprint = tuple((option_name, freeze_option_value(getattr(world.options, option_name).value))
+                            for option_name in sorted(world.options_dataclass.type_hints) if option_name not in common_options)
+        world.options_fingerprint = fingerprint
+    return fingerprint
+
+# (kind, fingerprint) -> what was worked out for it, least recently used first
+shared_by_fingerprint: OrderedDict[tuple, Any] = OrderedDict()
+shared_by_fingerprint_limit = 64
+
+def get_shared(kind: str, fingerprint: Optional[tuple], build: Callable[[], Any]) -> Any:
+    """Returns build(), only calling it for the first player with this fingerprint in the process, the others get the same result.\n
+    The result is shared between players so it must never be modified. Without a fingerprint, build() is called every time."""
+    if fingerprint is None:
+        return build()
+
+    key = (kind, fingerprint)
+    if key in shared_by_fingerprint:
+        shared_by_fingerprint.move_to_end(key)
+        return shared_by_fingerprint[key]
+
+    result = build()
+    shared_by_fingerprint[key] = result
+    if len(shared_by_fingerprint) > shared_by_fingerprint_limit:
+        shared_by_fingerprint.popitem(last=False)
+    return result
+
+class PlayerItems:
+    """The items of a player, in the item pool or already placed at a location, so looking them up doesn't go through every item of the multiworld.\n
+    Captured by ManualWorld.create_items from its pool, then synced once more at the start of pre_fill,
+    after AP has taken the start_inventory_from_pool items out of the pool. Placing items doesn't change whose they are, so nothing else has to keep it current,
+    but a hook that adds or removes items of the player after create_items should tell it with add and remove.\n
+    The precollected items aren't part of it, they're read from the multiworld as they are.
+    """
+    def __init__(self, multiworld: MultiWorld, player: int, items: Iterable[Item] = ()):
+        self.multiworld = multiworld
+        self.player = player
+        self.items: dict[int, Item] = {}
+        self.version = 0
+        self.add(items)
+
+    def add(self, items: Iterable[Item]):
+        before = len(self.items)
+        self.items.update((id(item), item) for item in items if item.player == self.player)
+        if len(self.items) != before:
+            self.version += 1
+
+    def remove(self, items: Iterable[Item]):
+        before = len(self.items)
+        for item in items:
+            self.items.pop(id(item), None)
+        if len(self.items) != before:
+            self.version += 1
+
+    def sync(self, items: Iterable[Item]):
+        """Make it these items, only changing version if they aren't the same ones"""
+        items = {id(item): item for item in items if item.player == self.player}
+        if items.keys() != self.items.keys():
+            self.items = items
+            self.version += 1
+
+    def get_items(self, include_precollected: bool = False) -> List[Item]:
+        items = list(self.items.values())
+        if include_precollected:
+            items.extend(self.multiworld.precollected_items.get(self.player, []))
+        return items
+
+    @property
+    def cache_key(self) -> tuple[int, int]:
+        """Changes whenever the items of the player could have, what's worked out from them can be kept as long as it doesn't"""
+        return self.version, len(self.multiworld.precollected_items.get(self.player, []))
+
+def get_player_items(multiworld: MultiWorld, player: int) -> Optional[PlayerItems]:
+    """The PlayerItems of a player, if their world keeps one and it was captured already"""
+    return getattr(multiworld.worlds.get(player), "player_items", None)
+
 def get_items_for_player(multiworld: MultiWorld, player: int, includePrecollected: bool = False) -> List[Item]:
     """Return list of items of a player including placed items"""
+    player_items = get_player_items(multiworld, player)
+    if player_items is not None:
+        return player_items.get_items(includePrecollected)
+
     items = [i for i in multiworld.get_items() if i.player == player]
     if includePrecollected:
         items.extend(multiworld.precollected_items.get(player, []))
     return items
 
 def reset_specific_item_value_cache_for_player(world: World, value: str, player: Optional[int] = None) -> dict[str, int]:
+    """Not needed anymore when the player has a PlayerItems, the cache is reset by itself when their items change"""
     if player is None:
         player = world.player
-    return world.item_values[player].pop(value, {})
+    return world.item_values.get(player, {}).pop(value, {})
 
 def reset_item_value_cache_for_player(world: World, player: Optional[int] = None):
+    """Not needed anymore when the player has a PlayerItems, the cache is reset by itself when their items change"""
     if player is None:
         player = world.player
     world.item_values[player] = {}
@@ -144,7 +327,8 @@ def get_items_with_value(world: World, multiworld: MultiWorld, value: str, playe
     """Return a dict of every items with a specific value type present in their respective 'value' dict\n
     Output in the format 'Item Name': 'value count'\n
     Keep a cache of the result, it can be skipped with 'skipCache == True'\n
-    To force a Reset of the player's cache of a value use either reset_specific_item_value_cache_for_player or reset_item_value_cache_for_player
+    The cache is reset when the player's items change, reset_specific_item_value_cache_for_player or reset_item_value_cache_for_player
+    can still force it for players without a PlayerItems
     """
     if player is None:
         player = world.player
@@ -159,9 +343,14 @@ def get_items_with_value(world: World, multiworld: MultiWorld, value: str, playe
     if not skipCache:
         if not hasattr(world, 'item_values'): #Cache of just the item values
             world.item_values = {}
+        if not hasattr(world, 'item_values_keys'): #What the player's items were when each player's values were cached
+            world.item_values_keys = {}
 
-        if not world.item_values.get(player):
+        index = get_player_items(multiworld, player)
+        cache_key = index.cache_key if index is not None else None
+        if not world.item_values.get(player) or world.item_values_keys.get(player) != cache_key:
             world.item_values[player] = {}
+            world.item_values_keys[player] = cache_key
 
     if value not in world.item_values.get(player, {}).keys() or skipCache:
         item_with_values = {i.name: world.item_name_to_item[i.name]['value'].get(value, 0)
@@ -177,30 +366,15 @@ def filter_used_regions(player_regions: dict|list) -> set:
     """Return a set of regions that are actually used in Generation. It includes region that have no locations but are required by other regions\n
     The dict version of the player_regions must be in the format: dict(region name str: region)
     """
-    used_regions = set()
-
     if isinstance(player_regions, list):
         player_regions = {r.name: r for r in player_regions}
 
     #Grab all the player's regions and take note of those with locations
-    for region in player_regions.values():
-        if region.locations:
-            used_regions.add(region)
-
-    #Check every known region with location for parent regions
-    checked_parent = []
-    for region in set(used_regions):
-        def checkParent(parent_region):
-            if parent_region.name in checked_parent: #dont check a region twice
-                return
-            checked_parent.append(parent_region.name)
-            used_regions.add(parent_region)
-            for entrance in parent_region.entrances:
-                if player_regions.get(entrance.parent_region.name):
-                    checkParent(entrance.parent_region)
-            return
-        checkParent(region)
-    return used_regions
+    regions_with_locations = [name for name, region in player_regions.items() if region.locations]
+
+    #Add every region they can be reached from
+    region_graph = RegionGraph.from_regions(player_regions.values())
+    return {player_regions[name] for name in region_graph.leading_to(regions_with_locations)}
 
 def convert_to_long_string(input: str | list[str]) -> str:
     """Verify that the input is a str. If it's a list[str] then it combine them into a str in a way that works with yaml template/website options descriptions"""
@@ -316,3 +490,79 @@ def convert_string_to_type(input: str, target_type: type) -> Any:
 
     newline = "\n"
     raise Exception(f"'{value}' could not be converted to {target_type}, here's the conversion failure message(s):\n\n{newline.join([' - ' + str(validation_error) for validation_error in errors])}\n\n")
+
+class DefinitionRecord(Mapping):
+    """Base of the frozen records the entries of the data files are turned into once they're processed.\n
+    The known keys get their own attribute (already normalized, like item.category being a tuple even when it's missing from the json)
+    while the record still reads like the original dict, so record["name"], record.get("category", []) and "requires" in record keep working.
+    It can't be written to like one though, code that changes what it gets (like the client adding categories) should work on record.to_dict().
+    Keys that aren't known are kept as they are in record.extra."""
+    __slots__ = ("present", "extra")
+    fields: tuple[str, ...] = ()
+    field_bits: dict[str, int] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.field_bits = {field: bit for bit, field in enumerate(cls.fields)}
+
+    def __init__(self, data: Mapping):
+        present = 0
+        for field, bit in self.field_bits.items():
+            if field in data:
+                present |= 1 << bit
+        object.__setattr__(self, "present", present)
+        object.__setattr__(self, "extra", {key: value for key, value in data.items() if key not in self.field_bits} or None)
+        self.set_fields(data)
+
+    @abstractmethod
+    def set_fields(self, data: Mapping):
+        """Fill the attributes of every field from data, using object.__setattr__ since the record is frozen"""
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is frozen, make a new one from its to_dict() instead")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is frozen, make a new one from its to_dict() instead")
+
+    def __reduce__(self):
+        return type(self), (self.to_dict(),)
+
+    def __getitem__(self, key):
+        bit = self.field_bits.get(key)
+        if bit is not None:
+            if self.present >> bit & 1:
+                return getattr(self, key)
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        bit = self.field_bits.get(key)
+        if bit is not None:
+            return getattr(self, key) if self.present >> bit & 1 else default
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key) -> bool:
+        bit = self.field_bits.get(key)
+        if bit is not None:
+            return bool(self.present >> bit & 1)
+        return self.extra is not None and key in self.extra
+
+    def __iter__(self):
+        for field, bit in self.field_bits.items():
+            if self.present >> bit & 1:
+                yield field
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return bin(self.present).count("1") + (len(self.extra) if self.extra is not None else 0)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        """A plain dict copy of the record, with lists instead of tuples, eg. to be sent to the client as json"""
+        return {key: list(value) if isinstance(value, tuple) else value for key, value in self.items()}
@@ -1,6 +1,46 @@
-from BaseClasses import Item
+import sys
+
+from BaseClasses import Item, ItemClassification
 from .Data import item_table
 from .Game import filler_item_name, starting_index
+from .Helpers import format_state_prog_items_key, ProgItemsCat, DefinitionRecord
+
+
+######################
+# Item records
+######################
+
+class ManualItemDef(DefinitionRecord):
+    """An item of items.json, see DefinitionRecord"""
+    fields = ("name", "id", "category", "progression", "useful", "trap", "filler", "progression_skip_balancing", "count", "value")
+    __slots__ = fields + ("classification",)
+
+    def set_fields(self, data):
+        set_field = object.__setattr__
+        set_field(self, "name", data["name"])
+        set_field(self, "id", data.get("id"))
+        categories = data.get("category", ())
+        if isinstance(categories, str):
+            categories = [categories]
+        set_field(self, "category", tuple(sys.intern(c) for c in categories))
+        for flag in ("progression", "useful", "trap", "filler", "progression_skip_balancing"):
+            set_field(self, flag, bool(data.get(flag, False)))
+        try:
+            set_field(self, "count", int(data.get("count", 1)))
+        except (TypeError, ValueError):
+            raise ValueError(f"{data['name']} has an invalid count of '{data['count']}'. Count must be an integer")
+        set_field(self, "value", dict(data.get("value", {})))
+
+        classification = ItemClassification.filler
+        if self.trap:
+            classification |= ItemClassification.trap
+        if self.useful:
+            classification |= ItemClassification.useful
+        if self.progression_skip_balancing:
+            classification |= ItemClassification.progression_skip_balancing
+        elif self.progression:
+            classification |= ItemClassification.progression
+        set_field(self, "classification", classification)
 
 
 ######################
@@ -8,7 +48,7 @@ from .Game import filler_item_name, starting_index
 ######################
 
 item_id_to_name: dict[int, str] = {}
-item_name_to_item: dict[str, dict] = {}
+item_name_to_item: dict[str, ManualItemDef] = {}
 item_name_groups: dict[str, str] = {}
 advancement_item_names: set[str] = set()
 lastItemId = -1
@@ -34,9 +74,15 @@ for key, val in enumerate(item_table):
     item_table[key]["progression"] = val["progression"] if "progression" in val else False
     if isinstance(val.get("category", []), str):
         item_table[key]["category"] = [val["category"]]
-        
+    #Just lowercase the values here to remove all the .lower.strip down the line
+    item_table[key]["value"] = {k.lower().strip(): v
+                                for k, v in val.get("value", {}).items()}
+
     count += 1
 
+# turn them into records now that they're done, in place so everything that already has item_table sees them
+item_table[:] = [ManualItemDef(item) for item in item_table]
+
 for item in item_table:
     item_name = item["name"]
     item_id_to_name[item["id"]] = item_name
@@ -50,11 +96,7 @@ for item in item_table:
             item_name_groups[c] = []
         item_name_groups[c].append(item_name)
 
-    #Just lowercase the values here to remove all the .lower.strip down the line
-    item['value'] = {k.lower().strip(): v
-                     for k, v in item.get('value', {}).items()}
-
-    for v in item.get("value", {}).keys():
+    for v in item.value.keys():
         group_name = f"has_{v}_value"
         if group_name not in item_name_groups:
             item_name_groups[group_name] = []
@@ -64,6 +106,71 @@ item_id_to_name[None] = "__Victory__"
 item_name_to_id = {name: id for id, name in item_id_to_name.items()}
 
 
+######################
+# Category index
+######################
+
+# The items of each category, so finding them doesn't need a scan of every item
+category_name_to_items: dict[str, tuple[str, ...]] = {}
+# The key used in state.prog_items to keep a count of the collected items of each category
+category_name_to_state_key: dict[str, str] = {}
+# The state keys an item adds to when collected
+item_name_to_category_state_keys: dict[str, tuple[str, ...]] = {}
+
+for item in item_table:
+    for c in dict.fromkeys(item.get("category", [])):
+        category_name_to_items[c] = category_name_to_items.get(c, ()) + (item["name"],)
+
+state_key_categories: dict[str, list[str]] = {}
+for c in category_name_to_items:
+    state_key_categories.setdefault(format_state_prog_items_key(ProgItemsCat.CATEGORY, c), []).append(c)
+
+for key, categories in state_key_categories.items():
+    if len(categories) == 1: # categories that only differ by their case or spaces would share a key, so they don't get one
+        category_name_to_state_key[categories[0]] = key
+
+for item in item_table:
+    keys = tuple(category_name_to_state_key[c] for c in dict.fromkeys(item.get("category", [])) if c in category_name_to_state_key)
+    if keys:
+        item_name_to_category_state_keys[item["name"]] = keys
+
+
+######################
+# Value index
+######################
+
+# The state keys and amounts an item adds to its values when collected, so collecting it doesn't format keys or parse numbers.
+# Items without values aren't in it.
+item_name_to_value_deltas: dict[str, tuple[tuple[str, int], ...]] = {}
+
+for item in item_table:
+    deltas = []
+    for v, amount in item.value.items():
+        try:
+            deltas.append((format_state_prog_items_key(ProgItemsCat.VALUE, v), int(amount)))
+        except (TypeError, ValueError):
+            raise ValueError(f"{item['name']} has an invalid value for '{v}'. Values must be whole numbers, not {amount!r}")
+    if deltas:
+        item_name_to_value_deltas[item["name"]] = tuple(deltas)
+
+
+######################
+# State key index
+######################
+
+# A dense index for every state key collecting an item can change, used by the array form of the state counts
+state_key_to_index: dict[str, int] = {}
+# The state keys that change when an item is collected or removed, its name included
+item_name_to_state_keys: dict[str, tuple[str, ...]] = {}
+
+for item in item_table:
+    keys = (item["name"],) + item_name_to_category_state_keys.get(item["name"], ()) + \
+        tuple(format_state_prog_items_key(ProgItemsCat.VALUE, v) for v in item.get("value", {}))
+    item_name_to_state_keys[item["name"]] = keys
+    for key in keys:
+        state_key_to_index.setdefault(key, len(state_key_to_index))
+
+
 ######################
 # Item classes
 ######################
@@ -1,6 +1,34 @@
+import sys
+
 from BaseClasses import Location
 from .Data import location_table
 from .Game import starting_index
+from .Helpers import DefinitionRecord
+
+
+######################
+# Location records
+######################
+
+class ManualLocationDef(DefinitionRecord):
+    """A location of locations.json, see DefinitionRecord"""
+    fields = ("name", "id", "region", "category", "requires", "victory",
+              "place_item", "place_item_category", "dont_place_item", "dont_place_item_category", "hint_entrance")
+    __slots__ = fields
+
+    def set_fields(self, data):
+        set_field = object.__setattr__
+        set_field(self, "name", data["name"])
+        set_field(self, "id", data.get("id"))
+        set_field(self, "region", data.get("region"))
+        categories = data.get("category", ())
+        if isinstance(categories, str):
+            categories = [categories]
+        set_field(self, "category", tuple(sys.intern(c) for c in categories))
+        set_field(self, "requires", data.get("requires"))
+        set_field(self, "victory", bool(data.get("victory", False)))
+        for field in ("place_item", "place_item_category", "dont_place_item", "dont_place_item_category", "hint_entrance"):
+            set_field(self, field, data.get(field))
 
 
 ######################
@@ -43,8 +71,11 @@ if not victory_names:
     })
     victory_names.append("__Manual Game Complete__")
 
+# turn them into records now that they're done, in place so everything that already has location_table sees them
+location_table[:] = [ManualLocationDef(location) for location in location_table]
+
 location_id_to_name: dict[int, str] = {}
-location_name_to_location: dict[str, dict] = {}
+location_name_to_location: dict[str, ManualLocationDef] = {}
 location_name_groups: dict[str, list[str]] = {}
 
 for item in location_table:
@@ -60,6 +91,18 @@ for item in location_table:
 # location_id_to_name[None] = "__Manual Game Complete__"
 location_name_to_id = {name: id for id, name in location_id_to_name.items()}
 
+
+def group_locations_by_region(locations: list) -> dict[str, list[ManualLocationDef]]:
+    """The locations of each region, in the order of locations"""
+    region_locations: dict[str, list[ManualLocationDef]] = {}
+    for location in locations:
+        if "region" in location:
+            region_locations.setdefault(location["region"], []).append(location)
+    return region_locations
+
+# So creating the regions of a player doesn't need a scan of every location per region
+region_name_to_locations = group_locations_by_region(location_table)
+
 ######################
 # Location classes
 ######################
@@ -103,6 +103,7 @@ class ManualContext(SuperContext):
                 super().set_events_callback(self.on_tracker_events) # Universal Tracker takes this func and calls it when events are calculated
 
         self.send_index: int = 0
+        self.world_definitions: dict[tuple[str, str], dict[str, dict[str, Any]]] = {}
         self.syncing = False
         self.game = game
         self.username = player_name
@@ -144,11 +145,24 @@ class ManualContext(SuperContext):
         from .Game import game_name  # This will at least give us the name of a manual they've installed
         return Utils.persistent_load().get("client", {}).get("last_manual_game", game_name)
 
+    def get_world_definition(self, table_name: str, name: str) -> dict[str, Any]:
+        """The definition the installed apworld has for name, for when there's no .apmanual to read it from.\n
+        The apworld keeps them as frozen records while the client changes what it gets (eg. adding the "(Hinted)" category),
+        so this returns a dict copy of it, made once so the changes stick around like they do in self.location_table."""
+        copies = self.world_definitions.setdefault((self.game, table_name), {})
+        if name not in copies:
+            definition = getattr(AutoWorldRegister.world_types[self.game], table_name).get(name)
+            if definition is None:
+                copies[name] = {"name": name}
+            else:
+                copies[name] = definition.to_dict() if hasattr(definition, "to_dict") else dict(definition)
+        return copies[name]
+
     def get_location_by_name(self, name) -> dict[str, Any]:
         location = self.location_table.get(name)
         if not location:
             # It is absolutely possible to pull categories from the data_package via self.update_game. I have not done this yet.
-            location = AutoWorldRegister.world_types[self.game].location_name_to_location.get(name, {"name": name})
+            location = self.get_world_definition("location_name_to_location", name)
         return location
 
     def get_location_by_id(self, id) -> dict[str, Any]:
@@ -158,7 +172,7 @@ class ManualContext(SuperContext):
     def get_item_by_name(self, name):
         item = self.item_table.get(name)
         if not item:
-            item = AutoWorldRegister.world_types[self.game].item_name_to_item.get(name, {"name": name})
+            item = self.get_world_definition("item_name_to_item", name)
         return item
 
     def get_item_by_id(self, id):
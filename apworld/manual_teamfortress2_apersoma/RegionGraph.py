@@ -0,0 +1,118 @@
+from collections import deque
+from typing import Iterable, Optional
+
+
+class RegionGraph:
+    """The connections between regions by name, for the reachability questions that don't depend on a state"""
+
+    def __init__(self, connections: dict[str, Iterable[str]]):
+        """connections is a dict of region name: the names of the regions it connects to.\n
+        Connections to a name that isn't one of its keys are ignored, DataValidation reports those."""
+        self.exits: dict[str, tuple[str, ...]] = {}
+        self.entrances: dict[str, list[str]] = {name: [] for name in connections}
+        for name, connects_to in connections.items():
+            exits = tuple(dict.fromkeys(target for target in connects_to or () if target in self.entrances))
+            self.exits[name] = exits
+            for target in exits:
+                self.entrances[target].append(name)
+        self._components: Optional[dict[str, tuple[str, ...]]] = None
+
+    @classmethod
+    def from_region_table(cls, region_table: dict) -> "RegionGraph":
+        """Build the graph of the regions of regions.json or of regionMap"""
+        return cls({name: region.get("connects_to") for name, region in region_table.items()})
+
+    @classmethod
+    def from_regions(cls, regions: Iterable) -> "RegionGraph":
+        """Build the graph of the Region objects of a player, following their exits"""
+        return cls({region.name: [exit.connected_region.name for exit in region.exits if exit.connected_region]
+                    for region in regions})
+
+    @staticmethod
+    def _walk(starts: Iterable[str], neighbours: dict[str, Iterable[str]]) -> set[str]:
+        found = {name for name in starts if name in neighbours}
+        queue = deque(found)
+        while queue:
+            for neighbour in neighbours[queue.popleft()]:
+                if neighbour not in found:
+                    found.add(neighbour)
+                    queue.append(neighbour)
+        return found
+
+    def reachable_from(self, starts: Iterable[str]) -> set[str]:
+        """The regions that can be reached from any of starts, starts included"""
+        return self._walk(starts, self.exits)
+
+    def leading_to(self, targets: Iterable[str]) -> set[str]:
+        """The regions any of targets can be reached from, targets included"""
+        return self._walk(targets, self.entrances)
+
+    def strongly_connected_components(self) -> dict[str, tuple[str, ...]]:
+        """The strongly connected component of every region: the regions it can reach that can also reach it, itself included.
+        The regions of a component are in the order of the graph."""
+        if self._components is not None:
+            return self._components
+
+        # Tarjan's algorithm, with an explicit stack so long chains of regions don't hit the recursion limit
+        order = {name: i for i, name in enumerate(self.exits)}
+        index: dict[str, int] = {}
+        lowlink: dict[str, int] = {}
+        component_stack: list[str] = []
+        on_stack: set[str] = set()
+        components: dict[str, tuple[str, ...]] = {}
+
+        for root in self.exits:
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                name, next_exit = work.pop()
+                if next_exit == 0:
+                    index[name] = lowlink[name] = len(index)
+                    component_stack.append(name)
+                    on_stack.add(name)
+                exits = self.exits[name]
+                while next_exit < len(exits):
+                    target = exits[next_exit]
+                    next_exit += 1
+                    if target not in index:
+                        work.append((name, next_exit))
+                        work.append((target, 0))
+                        break
+                    if target in on_stack:
+                        lowlink[name] = min(lowlink[name], index[target])
+                else:
+                    if lowlink[name] == index[name]:
+                        members = []
+                        while True:
+                            member = component_stack.pop()
+                            on_stack.discard(member)
+                            members.append(member)
+                            if member == name:
+                                break
+                        component = tuple(sorted(members, key=order.__getitem__))
+                        for member in component:
+                            components[member] = component
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[name])
+
+        self._components = components
+        return components
+
+    def unreachable_groups(self, starts: Iterable[str]) -> list[tuple[str, ...]]:
+        """The groups of regions that can't be reached from starts and that no other region leads to,
+        so they're what makes every unreachable region unreachable.
+        A group is a single region nothing connects to, or regions that only connect to each other."""
+        reachable = self.reachable_from(starts)
+        components = self.strongly_connected_components()
+        groups = []
+        for name in self.exits:
+            if name in reachable:
+                continue
+            component = components[name]
+            if component[0] != name: # only look at each component once
+                continue
+            if all(entrance in component for member in component for entrance in self.entrances[member]):
+                groups.append(component)
+        return groups
@@ -1,10 +1,31 @@
 from BaseClasses import Entrance, MultiWorld, Region
-from .Helpers import is_category_enabled, is_location_enabled
-from .Data import region_table
-from .Locations import ManualLocation, location_name_to_location
+from .Helpers import is_category_enabled, is_location_enabled, get_options_fingerprint, get_shared, DefinitionRecord
+from .Data import region_table, location_table
+from .Locations import ManualLocation, location_name_to_location, region_name_to_locations, group_locations_by_region
 from worlds.AutoWorld import World
 
 
+class ManualRegionDef(DefinitionRecord):
+    """A region of regions.json, see DefinitionRecord. Its name isn't part of the dict, it's the key it's under in regionMap"""
+    fields = ("requires", "connects_to", "starting", "entrance_requires", "exit_requires")
+    __slots__ = fields + ("name",)
+
+    def __init__(self, name: str, data):
+        object.__setattr__(self, "name", name)
+        super().__init__(data)
+
+    def __reduce__(self):
+        return type(self), (self.name, self.to_dict())
+
+    def set_fields(self, data):
+        set_field = object.__setattr__
+        set_field(self, "requires", data.get("requires"))
+        set_field(self, "connects_to", data.get("connects_to"))
+        set_field(self, "starting", bool(data.get("starting", False)))
+        set_field(self, "entrance_requires", data.get("entrance_requires", {}))
+        set_field(self, "exit_requires", data.get("exit_requires", {}))
+
+
 if not region_table:
     region_table = {}
 
@@ -12,16 +33,30 @@ regionMap = { **region_table }
 starting_regions = [ name for name in regionMap if "starting" in regionMap[name].keys() and regionMap[name]["starting"] ]
 
 if len(starting_regions) == 0:
-    starting_regions = region_table.keys() # the Manual region connects to all user-defined regions automatically if you specify no starting regions
+    starting_regions = list(region_table.keys()) # the Manual region connects to all user-defined regions automatically if you specify no starting regions
 
 regionMap["Manual"] = {
     "requires": [],
     "connects_to": starting_regions
 }
+regionMap = {name: ManualRegionDef(name, region) for name, region in regionMap.items()}
 
 
 def create_regions(world: World, multiworld: MultiWorld, player: int):
     # Create regions and assign locations to each region
+    if world.location_table is location_table:
+        locations_by_region = region_name_to_locations
+        fingerprint = get_options_fingerprint(world)
+    else:
+        locations_by_region = group_locations_by_region(world.location_table)
+        fingerprint = None
+
+    def get_enabled_locations() -> dict[str, tuple[str, ...]]:
+        return {region: tuple(location["name"] for location in locations_by_region.get(region, []) if is_location_enabled(multiworld, player, location))
+                for region in regionMap}
+    # players with the same options have the same locations enabled
+    enabled_locations = get_shared("enabled_locations", fingerprint, get_enabled_locations)
+
     for region in regionMap:
         if "connects_to" not in regionMap[region]:
             exit_array = None
@@ -32,13 +67,7 @@ def create_regions(world: World, multiworld: MultiWorld, player: int):
         if not exit_array:
             exit_array = None
 
-        locations = []
-        for location in world.location_table:
-            if "region" in location and location["region"] == region:
-                if is_location_enabled(multiworld, player, location):
-                    locations.append(location["name"])
-
-        new_region = create_region(world, multiworld, player, region, locations, exit_array)
+        new_region = create_region(world, multiworld, player, region, enabled_locations[region], exit_array)
         multiworld.regions += [new_region]
 
     menu = create_region(world, multiworld, player, "Menu", None, ["Manual"])
@@ -1,11 +1,15 @@
-from typing import TYPE_CHECKING, Optional
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, NamedTuple, Optional
 from enum import IntEnum
 from operator import eq, ge, le
 
 from .Regions import regionMap
+from .Game import game_name
+from .Items import state_key_to_index
+from .Data import location_table
 from .hooks import Rules
 from .Helpers import clamp, is_item_enabled, is_option_enabled, get_option_value, convert_string_to_type,\
-    format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat
+    format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat, get_options_fingerprint, get_shared
 
 from BaseClasses import MultiWorld, CollectionState
 from worlds.AutoWorld import World
@@ -13,10 +17,17 @@ from worlds.generic.Rules import set_rule, add_rule
 from Options import Choice, Toggle, Range, NamedRange
 
 import re
+from array import array
+from collections import Counter
 import math
 import inspect
 import logging
 
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
 if TYPE_CHECKING:
     from . import ManualWorld
 
@@ -45,303 +56,824 @@ def construct_logic_error(location_or_region: dict, source: LogicErrorSource) ->
 
     return KeyError(f"Invalid 'requires' for {object_type} '{object_name}': {source_text} (ERROR {source})")
 
-def infix_to_postfix(expr, location):
-    prec = {"&": 2, "|": 2, "!": 3}
-    stack = []
-    postfix = ""
-
-    try:
-        for c in expr:
-            if c.isnumeric():
-                postfix += c
-            elif c in prec:
-                while stack and stack[-1] != "(" and prec[c] <= prec[stack[-1]]:
-                    postfix += stack.pop()
-                stack.append(c)
-            elif c == "(":
-                stack.append(c)
-            elif c == ")":
-                while stack and stack[-1] != "(":
-                    postfix += stack.pop()
-                stack.pop()
-
-        while stack:
-            postfix += stack.pop()
-    except Exception:
-        raise construct_logic_error(location, LogicErrorSource.INFIX_TO_POSTFIX)
-
-    return postfix
-
-
-def evaluate_postfix(expr: str, location: str) -> bool:
-    stack = []
-
-    try:
-        for c in expr:
-            if c == "0":
-                stack.append(False)
-            elif c == "1":
-                stack.append(True)
-            elif c == "&":
-                op2 = stack.pop()
-                op1 = stack.pop()
-                stack.append(op1 and op2)
-            elif c == "|":
-                op2 = stack.pop()
-                op1 = stack.pop()
-                stack.append(op1 or op2)
-            elif c == "!":
-                op = stack.pop()
-                stack.append(not op)
-    except Exception:
-        raise construct_logic_error(location, LogicErrorSource.EVALUATE_POSTFIX)
-
-    if len(stack) != 1:
-        raise construct_logic_error(location, LogicErrorSource.EVALUATE_STACK_SIZE)
-
-    return stack.pop()
+class RequireNode(ABC):
+    """A node of a compiled requires. Nodes only read from the CollectionState, everything else is resolved when compiled."""
+    __slots__ = ()
 
-def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
-    # this is only called when the area (think, location or region) has a "requires" field that is a string
-    def checkRequireStringForArea(state: CollectionState, area: dict):
-        requires_list = area["requires"]
+    @abstractmethod
+    def evaluate(self, context: "RequiresContext", state: CollectionState, counts) -> bool:
+        """Whether the requirement of this node is met in state"""
 
-        # Get the "real" item counts of item in the pool/placed/starting_items
-        items_counts = world.get_item_counts(player, only_progression=True)
-
-        # Preparing some variables for exception messages
-        area_type = "region" if area.get("is_region",False) else "location"
-        area_name = area.get("name", f"unknown with these parameters: {area}")
-
-        if requires_list == "":
-            return True
-
-        def findAndRecursivelyExecuteFunctions(requires_list: str, recursionDepth: int = 0) -> str:
-            found_functions = re.findall(r'\{(\w+)\((.*?)\)\}', requires_list)
-            if found_functions:
-                if recursionDepth > world.rules_functions_maximum_recursion:
-                    raise RecursionError(f'One or more functions in {area_type} "{area_name}"\'s requires looped too many time (maximum recursion is {world.rules_functions_maximum_recursion}) \
-                                         \n    As of this Exception the following function(s) are waiting to run: {[f[0] for f in found_functions]} \
-                                         \n    And the currently processed requires look like this: "{requires_list}"')
-                else:
-                    for item in found_functions:
-                        func_name = item[0]
-                        func_args = item[1].split(",")
-                        if func_args == ['']:
-                            func_args.pop()
-
-                        func = globals().get(func_name)
-
-                        if func is None:
-                            func = getattr(Rules, func_name, None)
-
-                        if not callable(func):
-                            raise ValueError(f'Invalid function "{func_name}" in {area_type} "{area_name}".')
-
-                        convert_req_function_args(state, func, func_args, area_name)
-                        try:
-                            result = func(*func_args)
-                        except Exception as ex:
-                            raise RuntimeError(f'A call to the function "{func_name}" in {area_type} "{area_name}"\'s requires raised an Exception. \
-                                                \nUnless it was called by another function, it should look something like "{{{func_name}({item[1]})}}" in {area_type}s.json. \
-                                                \nFull error message: \
-                                                \n\n{type(ex).__name__}: {ex}')
-                        if isinstance(result, bool):
-                            requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", "1" if result else "0")
-                        else:
-                            requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", str(result))
-
-                requires_list = findAndRecursivelyExecuteFunctions(requires_list, recursionDepth + 1)
-            return requires_list
-
-        requires_list = findAndRecursivelyExecuteFunctions(requires_list)
-
-        # parse user written statement into list of each item
-        for item in re.findall(r'\|[^|]+\|', requires_list):
-            require_type = 'item'
-
-            if '|@' in item:
-                require_type = 'category'
-
-            item_base = item
-            item = item.lstrip('|@$').rstrip('|')
-
-            item_parts = item.split(":")  # type: list[str]
-            item_name = item
-            item_count = "1"
-
-
-            if len(item_parts) > 1:
-                item_name = item_parts[0].strip()
-                item_count = item_parts[1].strip()
-
-            total = 0
-
-            if require_type == 'category':
-                category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-                category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
-                if item_count.lower() == 'all':
-                    item_count = category_items_counts
-                elif item_count.lower() == 'half':
-                    item_count = int(category_items_counts / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(category_items_counts * percent)
-                else:
-                    try:
-                        item_count = int(item_count)
-                    except ValueError as e:
-                        raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
-
-                for category_item in category_items:
-                    total += state.count(category_item["name"], player)
-
-                    if total >= item_count:
-                        requires_list = requires_list.replace(item_base, "1")
-            elif require_type == 'item':
-                item_current_count = items_counts.get(item_name, 0)
-                if item_count.lower() == 'all':
-                    item_count = item_current_count
-                elif item_count.lower() == 'half':
-                    item_count = int(item_current_count / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(item_current_count * percent)
-                else:
-                    item_count = int(item_count)
+    def estimate(self, context: "RequiresContext") -> tuple[float, float]:
+        """Returns a rough (cost, likelihood to be met) of evaluating this node, used to order the operands of AND/OR"""
+        return 1.0, 0.5
 
-                total = state.count(item_name, player)
+    def add_dependencies(self, keys: set[str]) -> bool:
+        """Add the state keys this node reads to keys, returns False if it could depend on anything in the state"""
+        return True
 
-                if total >= item_count:
-                    requires_list = requires_list.replace(item_base, "1")
+class RequireConstant(RequireNode):
+    __slots__ = ("value",)
 
-            if total <= item_count:
-                requires_list = requires_list.replace(item_base, "0")
+    def __init__(self, value: bool):
+        self.value = value
 
-        requires_list = re.sub(r'\s?\bAND\b\s?', '&', requires_list, 0, re.IGNORECASE)
-        requires_list = re.sub(r'\s?\bOR\b\s?', '|', requires_list, 0, re.IGNORECASE)
+    def evaluate(self, context, state, counts) -> bool:
+        return self.value
 
-        requires_string = infix_to_postfix("".join(requires_list), area)
-        return (evaluate_postfix(requires_string, area))
+    def estimate(self, context) -> tuple[float, float]:
+        return 0.0, float(self.value)
 
-    # this is only called when the area (think, location or region) has a "requires" field that is a dict
-    def checkRequireDictForArea(state: CollectionState, area: dict):
-        canAccess = True
+class RequireItem(RequireNode):
+    """|Item Name:count|"""
+    __slots__ = ("name", "count", "slot")
 
-        for item in area["requires"]:
-            # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
-            if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                canAccessOr = True
-                or_items = item
+    def __init__(self, name: str, count: int, slot):
+        self.name = name
+        self.count = count
+        self.slot = slot
 
-                if isinstance(item, dict):
-                    or_items = item["or"]
+    def evaluate(self, context, state, counts) -> bool:
+        return counts[self.slot] >= self.count
 
-                for or_item in or_items:
-                    or_item_parts = or_item.split(":")
-                    or_item_name = or_item
-                    or_item_count = 1
+    def estimate(self, context) -> tuple[float, float]:
+        return 1.0, estimate_count_likelihood(self.count, context.items_counts.get(self.name, 0))
 
-                    if len(or_item_parts) > 1:
-                        or_item_name = or_item_parts[0]
-                        or_item_count = int(or_item_parts[1])
+    def add_dependencies(self, keys: set[str]) -> bool:
+        keys.add(self.name)
+        return True
 
-                    if not state.has(or_item_name, player, or_item_count):
-                        canAccessOr = False
+class RequireCategory(RequireNode):
+    """|@Category Name:count|"""
+    __slots__ = ("name", "members", "count", "slots")
 
-                if canAccessOr:
-                    canAccess = True
-                    break
-            else:
-                item_parts = item.split(":")
-                item_name = item
-                item_count = 1
+    def __init__(self, name: str, members: tuple[str, ...], count: int, slots: tuple):
+        self.name = name
+        self.members = members
+        self.count = count
+        self.slots = slots
 
-                if len(item_parts) > 1:
-                    item_name = item_parts[0]
-                    item_count = int(item_parts[1])
+    def evaluate(self, context, state, counts) -> bool:
+        return sum(counts[slot] for slot in self.slots) >= self.count
 
-                if not state.has(item_name, player, item_count):
-                    canAccess = False
+    def estimate(self, context) -> tuple[float, float]:
+        return float(len(self.members)), estimate_count_likelihood(self.count, context.category_total(self.name))
 
-        return canAccess
+    def add_dependencies(self, keys: set[str]) -> bool:
+        keys.update(self.members)
+        return True
 
-    # handle any type of checking needed, then ferry the check off to a dedicated method for that check
-    def fullLocationOrRegionCheck(state: CollectionState, area: dict):
-        # if it's not a usable object of some sort, default to true
-        if not area:
-            return True
+class RequireCategoryCount(RequireNode):
+    """|@Category Name:count| using the count of the category's collected items kept by ManualWorld.collect"""
+    __slots__ = ("name", "key", "count", "slot")
 
-        # don't require the "requires" key for locations and regions if they don't need to use it
-        if "requires" not in area.keys():
-            return True
+    def __init__(self, name: str, key: str, count: int, slot):
+        self.name = name
+        self.key = key
+        self.count = count
+        self.slot = slot
 
-        if isinstance(area["requires"], str):
-            return checkRequireStringForArea(state, area)
-        else:  # item access is in dict form
-            return checkRequireDictForArea(state, area)
+    def evaluate(self, context, state, counts) -> bool:
+        return counts[self.slot] >= self.count
 
-    used_location_names = []
-    # Region access rules
-    for region in regionMap.keys():
-        used_location_names.extend([l.name for l in multiworld.get_region(region, player).locations])
-        if region != "Menu":
-            for exitRegion in multiworld.get_region(region, player).entrances:
-                def fullRegionCheck(state: CollectionState, region=regionMap[region], region_name=exitRegion.name):
-                    region['name'] = region_name
-                    region['is_region'] = True
+    def estimate(self, context) -> tuple[float, float]:
+        return 1.0, estimate_count_likelihood(self.count, context.category_total(self.name))
 
-                    return fullLocationOrRegionCheck(state, region)
+    def add_dependencies(self, keys: set[str]) -> bool:
+        keys.add(self.key)
+        return True
 
-                add_rule(world.get_entrance(exitRegion.name), fullRegionCheck)
-            entrance_rules = regionMap[region].get("entrance_requires", {})
-            for e in entrance_rules:
-                entrance = world.get_entrance(f'{e}To{region}')
-                add_rule(entrance, lambda state, rule={"requires": entrance_rules[e]}: fullLocationOrRegionCheck(state, rule))
-            exit_rules = regionMap[region].get("exit_requires", {})
-            for e in exit_rules:
-                exit = world.get_entrance(f'{region}To{e}')
-                add_rule(exit, lambda state, rule={"requires": exit_rules[e]}: fullLocationOrRegionCheck(state, rule))
+class RequireStateItem(RequireItem):
+    """|Item Name:count| of an item the state counts array doesn't know about, like one created by a hook"""
+    __slots__ = ()
 
-    # Location access rules
-    for location in world.location_table:
-        if location["name"] not in used_location_names:
-            continue
+    def evaluate(self, context, state, counts) -> bool:
+        return state.prog_items[context.player][self.name] >= self.count
 
-        locFromWorld = multiworld.get_location(location["name"], player)
+class RequireAllItems(RequireNode):
+    """Several |Item Name| needed together, checked at once against the mask of the state counts array"""
+    __slots__ = ("names", "mask")
 
-        locationRegion = regionMap[location["region"]] if "region" in location else None
+    def __init__(self, names: tuple[str, ...], mask: int):
+        self.names = names
+        self.mask = mask
 
-        if locationRegion:
-            locationRegion['name'] = location['region']
-            locationRegion['is_region'] = True
+    def evaluate(self, context, state, counts) -> bool:
+        return counts.mask & self.mask == self.mask
 
-        if "requires" in location: # Location has requires, check them alongside the region requires
-            def checkBothLocationAndRegion(state: CollectionState, location=location, region=locationRegion):
-                locationCheck = fullLocationOrRegionCheck(state, location)
-                regionCheck = True # default to true unless there's a region with requires
+    def estimate(self, context) -> tuple[float, float]:
+        likelihood = 1.0
+        for name in self.names:
+            likelihood *= estimate_count_likelihood(1, context.items_counts.get(name, 0))
+        return 1.0, likelihood
+
+    def add_dependencies(self, keys: set[str]) -> bool:
+        keys.update(self.names)
+        return True
 
-                if region:
-                    regionCheck = fullLocationOrRegionCheck(state, region)
+class RequireAnyItem(RequireAllItems):
+    """Several |Item Name| where any of them is enough, checked at once against the mask of the state counts array"""
+    __slots__ = ()
+
+    def evaluate(self, context, state, counts) -> bool:
+        return counts.mask & self.mask != 0
+
+    def estimate(self, context) -> tuple[float, float]:
+        unlikelihood = 1.0
+        for name in self.names:
+            unlikelihood *= 1 - estimate_count_likelihood(1, context.items_counts.get(name, 0))
+        return 1.0, 1 - unlikelihood
+
+class RequireFunction(RequireNode):
+    """{FunctionName(args)} of a function that uses the state, so it's called every time it's evaluated"""
+    __slots__ = ("name", "func", "args", "area", "area_type", "area_name", "depth")
+
+    def __init__(self, name: str, func, args: str, area: dict, area_type: str, area_name: str, depth: int):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.area = area
+        self.area_type = area_type
+        self.area_name = area_name
+        self.depth = depth
+
+    def evaluate(self, context, state, counts) -> bool:
+        return context.call_function(self, state).evaluate(context, state, counts)
+
+    def estimate(self, context) -> tuple[float, float]:
+        return 100.0, 0.5 # unknown, but calling a function is always way more expensive than reading a count
+
+    def add_dependencies(self, keys: set[str]) -> bool:
+        # a function can read anything from the state, unless it says which keys it uses
+        dependencies = getattr(self.func, "dependencies", None)
+        if dependencies is None:
+            return False
+        keys.update(dependencies(self.args.strip()))
+        return True
+
+class RequireAll(RequireNode):
+    """AND of its operands, stops at the first one that isn't met"""
+    __slots__ = ("operands",)
 
-                return locationCheck and regionCheck
+    def __init__(self, operands: tuple[RequireNode, ...]):
+        self.operands = operands
 
-            set_rule(locFromWorld, checkBothLocationAndRegion)
-        elif "region" in location: # Only region access required, check the location's region's requires
-            def fullRegionCheck(state, region=locationRegion):
-                return fullLocationOrRegionCheck(state, region)
+    def evaluate(self, context, state, counts) -> bool:
+        for operand in self.operands:
+            if not operand.evaluate(context, state, counts):
+                return False
+        return True
 
-            set_rule(locFromWorld, fullRegionCheck)
-        else: # No location region and no location requires? It's accessible.
-            def allRegionsAccessible(state):
+    def estimate(self, context) -> tuple[float, float]:
+        cost = 0.0
+        likelihood = 1.0
+        for operand in self.operands:
+            operand_cost, operand_likelihood = operand.estimate(context)
+            cost += operand_cost
+            likelihood *= operand_likelihood
+        return cost, likelihood
+
+    def add_dependencies(self, keys: set[str]) -> bool:
+        known = True
+        for operand in self.operands:
+            known = operand.add_dependencies(keys) and known
+        return known
+
+class RequireAny(RequireNode):
+    """OR of its operands, stops at the first one that is met"""
+    __slots__ = ("operands",)
+
+    def __init__(self, operands: tuple[RequireNode, ...]):
+        self.operands = operands
+
+    def evaluate(self, context, state, counts) -> bool:
+        for operand in self.operands:
+            if operand.evaluate(context, state, counts):
                 return True
+        return False
 
-            set_rule(locFromWorld, allRegionsAccessible)
+    def estimate(self, context) -> tuple[float, float]:
+        cost = 0.0
+        unlikelihood = 1.0
+        for operand in self.operands:
+            operand_cost, operand_likelihood = operand.estimate(context)
+            cost += operand_cost
+            unlikelihood *= 1 - operand_likelihood
+        return cost, 1 - unlikelihood
 
-    # Victory requirement
-    multiworld.completion_condition[player] = lambda state: state.has("__Victory__", player)
+    def add_dependencies(self, keys: set[str]) -> bool:
+        known = True
+        for operand in self.operands:
+            known = operand.add_dependencies(keys) and known
+        return known
+
+class RequireNot(RequireNode):
+    __slots__ = ("operand",)
+
+    def __init__(self, operand: RequireNode):
+        self.operand = operand
+
+    def evaluate(self, context, state, counts) -> bool:
+        return not self.operand.evaluate(context, state, counts)
+
+    def estimate(self, context) -> tuple[float, float]:
+        cost, likelihood = self.operand.estimate(context)
+        return cost, 1 - likelihood
+
+    def add_dependencies(self, keys: set[str]) -> bool:
+        return self.operand.add_dependencies(keys)
+
+class RequireLegacyList(RequireNode):
+    """The dict/list form of requires, each entry is either ("item", name, count) or ("or", ((name, count), ...))"""
+    __slots__ = ("entries",)
+
+    def __init__(self, entries: tuple):
+        self.entries = entries
+
+    def evaluate(self, context, state, counts) -> bool:
+        counts = state.prog_items[context.player] # legacy requires can name any item, so they don't go through the state counts array
+        canAccess = True
+
+        for entry in self.entries:
+            if entry[0] == "or":
+                if all(counts[name] >= count for name, count in entry[1]):
+                    return True
+            elif counts[entry[1]] < entry[2]:
+                canAccess = False
+
+        return canAccess
+
+    def estimate(self, context) -> tuple[float, float]:
+        return float(sum(len(entry[1]) if entry[0] == "or" else 1 for entry in self.entries)), 0.5
+
+    def add_dependencies(self, keys: set[str]) -> bool:
+        for entry in self.entries:
+            if entry[0] == "or":
+                keys.update(name for name, count in entry[1])
+            else:
+                keys.add(entry[1])
+        return True
 
-    def convert_req_function_args(state: CollectionState, func, args: list[str], areaName: str):
+def estimate_count_likelihood(count: int, available: int) -> float:
+    """Rough chance that a count requirement is met, the closer it is to everything available the less likely it is"""
+    available = max(available, count)
+    return (available - count + 1) / (available + 1)
+
+def require_and(left: RequireNode, right: RequireNode) -> RequireNode:
+    if isinstance(left, RequireConstant):
+        return right if left.value else left
+    if isinstance(right, RequireConstant):
+        return left if right.value else right
+    operands = left.operands if isinstance(left, RequireAll) else (left,)
+    operands += right.operands if isinstance(right, RequireAll) else (right,)
+    return RequireAll(operands)
+
+def require_or(left: RequireNode, right: RequireNode) -> RequireNode:
+    if isinstance(left, RequireConstant):
+        return left if left.value else right
+    if isinstance(right, RequireConstant):
+        return right if right.value else left
+    operands = left.operands if isinstance(left, RequireAny) else (left,)
+    operands += right.operands if isinstance(right, RequireAny) else (right,)
+    return RequireAny(operands)
+
+def require_not(operand: RequireNode) -> RequireNode:
+    if isinstance(operand, RequireConstant):
+        return RequireConstant(not operand.value)
+    if isinstance(operand, RequireNot):
+        return operand.operand
+    return RequireNot(operand)
+
+def order_requires(node: RequireNode, context: "RequiresContext") -> RequireNode:
+    """Reorder the operands of every AND/OR so the cheapest ones that are the most likely to end the evaluation go first"""
+    if isinstance(node, RequireNot):
+        return RequireNot(order_requires(node.operand, context))
+    if not isinstance(node, (RequireAll, RequireAny)):
+        return node
+
+    stops_on_met = isinstance(node, RequireAny)
+    def sort_key(operand: RequireNode) -> float:
+        cost, likelihood = operand.estimate(context)
+        stop_chance = likelihood if stops_on_met else 1 - likelihood
+        return cost / max(stop_chance, 0.001)
+
+    operands = [order_requires(operand, context) for operand in node.operands]
+    if context.use_state_counts_array:
+        # items that only need to be there once can be checked all together with the state counts mask
+        single_items = [operand for operand in operands if type(operand) is RequireItem and operand.count == 1]
+        if len(single_items) > 1:
+            mask = 0
+            for operand in single_items:
+                mask |= 1 << operand.slot
+            items_node = (RequireAnyItem if stops_on_met else RequireAllItems)(tuple(operand.name for operand in single_items), mask)
+            operands = [operand for operand in operands if operand not in single_items] + [items_node]
+            if len(operands) == 1:
+                return items_node
+
+    return type(node)(tuple(sorted(operands, key=sort_key)))
+
+state_independent_functions: dict = {}
+def is_state_independent(func) -> bool:
+    """Can the function be run once when the rules are set instead of every time a requires is checked?\n
+    By default that's any function that doesn't ask for a CollectionState,
+    a function can override this by having a 'state_independent' attribute set to True or False."""
+    if func not in state_independent_functions:
+        independent = getattr(func, "state_independent", None)
+        if independent is None:
+            independent = all(parameter.annotation != CollectionState for parameter in inspect.signature(func).parameters.values())
+        state_independent_functions[func] = bool(independent)
+    return state_independent_functions[func]
+
+class CompiledRequires:
+    """The access rule given to AP, it evaluates a compiled requires against the state of its player."""
+    __slots__ = ("context", "node")
+
+    def __init__(self, context: "RequiresContext", node: RequireNode):
+        self.context = context
+        self.node = node
+
+    def __call__(self, state: CollectionState) -> bool:
+        if self.context.use_state_counts_array:
+            return self.node.evaluate(self.context, state, get_state_counts(state, self.context.player))
+        return self.node.evaluate(self.context, state, state.prog_items[self.context.player])
+
+class StateCounts(array):
+    """A player's state counts indexed by Items.state_key_to_index, with a bit set in mask for every key above 0"""
+    __slots__ = ("mask",)
+
+    def copy(self) -> "StateCounts":
+        counts = StateCounts("l", self)
+        counts.mask = self.mask
+        return counts
+
+# each Manual apworld keeps its own copy of this code, so the attribute needs to be unique to the game
+state_counts_attribute = f"manual_state_counts_{format_to_valid_identifier(game_name)}"
+
+def get_state_counts(state: CollectionState, player: int) -> StateCounts:
+    """Returns the player's state counts array, building it from state.prog_items if it doesn't exist yet"""
+    players = getattr(state, state_counts_attribute, None)
+    if players is None:
+        players = {}
+        setattr(state, state_counts_attribute, players)
+    counts = players.get(player)
+    if counts is None:
+        counts = build_state_counts(state.prog_items[player])
+        players[player] = counts
+    return counts
+
+def build_state_counts(prog_items: Counter) -> StateCounts:
+    counts = StateCounts("l", [0] * len(state_key_to_index))
+    counts.mask = 0
+    for key, value in prog_items.items():
+        index = state_key_to_index.get(key)
+        if index is not None:
+            counts[index] = value
+            if value > 0:
+                counts.mask |= 1 << index
+    return counts
+
+def update_state_counts(state: CollectionState, player: int, keys: tuple[str, ...]):
+    """Copy the new values of keys from state.prog_items to the state counts array, if the state has one yet"""
+    players = getattr(state, state_counts_attribute, None)
+    if not players or player not in players:
+        return # it will get built from state.prog_items when it's first needed
+    counts = players[player]
+    prog_items = state.prog_items[player]
+    for key in keys:
+        index = state_key_to_index.get(key)
+        if index is None:
+            continue
+        value = prog_items[key]
+        counts[index] = value
+        if value > 0:
+            counts.mask |= 1 << index
+        else:
+            counts.mask &= ~(1 << index)
+
+def copy_state_counts(old: CollectionState, new: CollectionState) -> CollectionState:
+    players = getattr(old, state_counts_attribute, None)
+    if players:
+        setattr(new, state_counts_attribute, {player: counts.copy() for player, counts in players.items()})
+    return new
+
+if hasattr(CollectionState, "additional_copy_functions"):
+    CollectionState.additional_copy_functions.append(copy_state_counts)
+
+def lower_requires(node: RequireNode) -> Optional[list[tuple[tuple[int, ...], int]]]:
+    """Turn a compiled requires into a list of (state counts indexes, count) that all need the sum of their indexes to be at least count.\n
+    Returns None if the requires can't be written that way, like when it calls a function."""
+    node_type = type(node)
+    if node_type is RequireConstant:
+        return [] if node.value else None
+    if node_type is RequireItem or node_type is RequireCategoryCount or node_type is RequireCategory:
+        keys = node.members if node_type is RequireCategory else (node.key if node_type is RequireCategoryCount else node.name,)
+        indexes = tuple(state_key_to_index.get(key) for key in keys)
+        if None in indexes:
+            return None
+        return [(indexes, node.count)]
+    if node_type is RequireAllItems:
+        return [((state_key_to_index[name],), 1) for name in node.names]
+    if node_type is RequireAnyItem:
+        return [(tuple(state_key_to_index[name] for name in node.names), 1)]
+    if node_type is RequireAll:
+        atoms = []
+        for operand in node.operands:
+            operand_atoms = lower_requires(operand)
+            if operand_atoms is None:
+                return None
+            atoms.extend(operand_atoms)
+        return atoms
+    if node_type is RequireAny:
+        # counts are never negative, so "any of them at least once" is their sum being at least 1
+        indexes = {}
+        for operand in node.operands:
+            operand_atoms = lower_requires(operand)
+            if operand_atoms is None or len(operand_atoms) != 1 or operand_atoms[0][1] != 1:
+                return None
+            indexes.update(dict.fromkeys(operand_atoms[0][0]))
+        return [(tuple(indexes), 1)]
+    return None
+
+class BatchRequires:
+    """Evaluates the requires of all of a player's locations for a state at once.\n
+    Requires made only of item and category counts are turned into matrices and checked in one go with NumPy,
+    the rest (and everything when NumPy isn't installed) are evaluated one by one."""
+
+    def __init__(self, context: "RequiresContext", location_rules: dict[str, RequireNode]):
+        self.context = context
+        self.fallback: list[tuple[str, RequireNode]] = []
+        self.lowered_names: list[str] = []
+        lowered_atoms: list[list[int]] = []
+        atom_rows: dict[tuple[tuple[int, ...], int], int] = {}
+
+        for name, node in location_rules.items():
+            atoms = lower_requires(node) if numpy is not None else None
+            if atoms is None:
+                self.fallback.append((name, node))
+                continue
+            self.lowered_names.append(name)
+            lowered_atoms.append([atom_rows.setdefault(atom, len(atom_rows)) for atom in atoms])
+
+        if self.lowered_names:
+            self.atom_matrix = numpy.zeros((len(atom_rows), len(state_key_to_index)), dtype=numpy.int64)
+            self.thresholds = numpy.zeros(len(atom_rows), dtype=numpy.int64)
+            for (indexes, count), row in atom_rows.items():
+                self.atom_matrix[row, list(indexes)] = 1
+                self.thresholds[row] = count
+            self.location_matrix = numpy.zeros((len(self.lowered_names), len(atom_rows)), dtype=numpy.int64)
+            for row, atoms in enumerate(lowered_atoms):
+                self.location_matrix[row, atoms] = 1
+
+    def evaluate(self, state: CollectionState) -> dict[str, bool]:
+        context = self.context
+        if context.use_state_counts_array:
+            counts = get_state_counts(state, context.player)
+        else:
+            counts = state.prog_items[context.player]
+        results = {name: node.evaluate(context, state, counts) for name, node in self.fallback}
+
+        if self.lowered_names:
+            if not context.use_state_counts_array:
+                counts = build_state_counts(counts) # not kept in sync by collect so it has to be rebuilt every time
+            vector = numpy.frombuffer(counts, dtype=numpy.dtype(counts.typecode)).astype(numpy.int64)
+            atoms_unmet = (self.atom_matrix @ vector < self.thresholds).astype(numpy.int64)
+            met = (self.location_matrix @ atoms_unmet) == 0
+            results.update(zip(self.lowered_names, met.tolist()))
+        return results
+
+requires_function_regex = re.compile(r'\{(\w+)\((.*?)\)\}')
+requires_item_regex = re.compile(r'\|[^|]+\|')
+requires_operator_regex = re.compile(r'\b(AND|OR)\b', re.IGNORECASE)
+
+def tokenize_requires(requires: str) -> list:
+    """Split a requires string into ("function", name, args), ("item", text), ("const", bool) and operator tokens.\n
+    Any other character is ignored."""
+    tokens = []
+    index = 0
+    length = len(requires)
+
+    while index < length:
+        c = requires[index]
+        if c == "{" and (match := requires_function_regex.match(requires, index)):
+            tokens.append(("function", match.group(1), match.group(2)))
+            index = match.end()
+            continue
+        if c == "|":
+            if match := requires_item_regex.match(requires, index):
+                tokens.append(("item", match.group(0)))
+                index = match.end()
+            else:
+                tokens.append("|")
+                index += 1
+            continue
+        if c in "aAoO" and (match := requires_operator_regex.match(requires, index)):
+            tokens.append("&" if match.group(1).lower() == "and" else "|")
+            index = match.end()
+            continue
+        if c in "&!()":
+            tokens.append(c)
+        elif c == "0" or c == "1":
+            tokens.append(("const", c == "1"))
+        index += 1
+
+    return tokens
+
+def resolve_requires_count(item_count: str, available: int) -> int:
+    """Convert the count part of |Item:count| (a number, 'all', 'half' or a 'N%') to an int"""
+    if item_count.lower() == 'all':
+        return available
+    elif item_count.lower() == 'half':
+        return int(available / 2)
+    elif item_count.endswith('%') and len(item_count) > 1:
+        percent = clamp(float(item_count[:-1]) / 100, 0, 1)
+        return math.ceil(available * percent)
+    return int(item_count)
+
+state_placeholder = object() # stands in for the state when working out a function's arguments
+
+class RequiresContext:
+    """Everything a player's compiled requires needs to evaluate its functions."""
+
+    def __init__(self, world: "ManualWorld", multiworld: MultiWorld, player: int):
+        self.world = world
+        self.multiworld = multiworld
+        self.player = player
+        # Get the "real" item counts of item in the pool/placed/starting_items
+        self.items_counts = world.get_item_counts(player, only_progression=True)
+        self.use_state_counts_array = world.use_state_counts_array
+        self.compiled_results: dict[tuple[str, int], RequireNode] = {}
+        self.function_bindings: dict[tuple[object, str], tuple[tuple, tuple[int, ...]]] = {}
+        self.category_totals: dict[str, int] = {}
+        # state key -> names of the locations/entrances whose rule reads it, filled by set_rules
+        self.location_dependents: dict[str, set[str]] = {}
+        self.entrance_dependents: dict[str, set[str]] = {}
+        # rules with a function that could read anything in the state
+        self.locations_depending_on_anything: set[str] = set()
+        self.entrances_depending_on_anything: set[str] = set()
+        # the compiled requires of every location, for BatchRequires
+        self.location_rules: dict[str, RequireNode] = {}
+        self.batch: Optional[BatchRequires] = None
+
+    def state_slot(self, key: str):
+        """Where a compiled node finds key in the counts it gets, None if the state counts array doesn't have it"""
+        if not self.use_state_counts_array:
+            return key
+        return state_key_to_index.get(key)
+
+    def category_total(self, category_name: str) -> int:
+        """The "real" count of progression items in a category"""
+        if category_name not in self.category_totals:
+            self.category_totals[category_name] = sum(self.items_counts.get(item_name, 0) for item_name in self.world.category_name_to_items.get(category_name, ()))
+        return self.category_totals[category_name]
+
+    def index_rule(self, spot_name: str, node: RequireNode, is_entrance: bool):
+        """Remember which state keys the rule of a location or entrance reads"""
+        keys: set[str] = set()
+        known = node.add_dependencies(keys)
+        dependents = self.entrance_dependents if is_entrance else self.location_dependents
+        for key in keys:
+            dependents.setdefault(key, set()).add(spot_name)
+        if not known:
+            (self.entrances_depending_on_anything if is_entrance else self.locations_depending_on_anything).add(spot_name)
+
+    def affected_locations(self, item_name: str) -> set[str]:
+        """Names of the locations whose access could change after the item is collected or removed,
+        including every location behind an entrance whose rule reads it.\n
+        Only rules made from requires are known, rules added in hooks aren't part of this."""
+        locations = set(self.locations_depending_on_anything)
+        entrances = set(self.entrances_depending_on_anything)
+        for key in self.world.item_name_to_state_keys.get(item_name, (item_name,)):
+            locations.update(self.location_dependents.get(key, ()))
+            entrances.update(self.entrance_dependents.get(key, ()))
+
+        regions = [self.multiworld.get_entrance(entrance, self.player).connected_region for entrance in entrances]
+        seen = set(regions)
+        while regions:
+            region = regions.pop()
+            locations.update(location.name for location in region.locations)
+            for region_exit in region.exits:
+                if region_exit.connected_region is not None and region_exit.connected_region not in seen:
+                    seen.add(region_exit.connected_region)
+                    regions.append(region_exit.connected_region)
+        return locations
+
+    def evaluate_locations(self, state: CollectionState) -> dict[str, bool]:
+        if self.batch is None:
+            self.batch = BatchRequires(self, self.location_rules)
+        return self.batch.evaluate(state)
+
+    def compile(self, area: dict, area_type: str, area_name: str) -> RequireNode:
+        """Compile the requires of a location or region into a tree of RequireNode"""
+        # don't require the "requires" key for locations and regions if they don't need to use it
+        if not area or "requires" not in area:
+            return RequireConstant(True)
+
+        if isinstance(area["requires"], str):
+            return self.compile_string(area["requires"], area, area_type, area_name)
+        else:  # item access is in dict form
+            return self.compile_legacy(area["requires"])
+
+    def compile_string(self, requires: str, area: dict, area_type: str, area_name: str, depth: int = 0) -> RequireNode:
+        if requires == "":
+            return RequireConstant(True)
+
+        tokens = tokenize_requires(requires)
+        functions = [token for token in tokens if isinstance(token, tuple) and token[0] == "function"]
+        if functions and depth > self.world.rules_functions_maximum_recursion:
+            raise RecursionError(f'One or more functions in {area_type} "{area_name}"\'s requires looped too many time (maximum recursion is {self.world.rules_functions_maximum_recursion}) \
+                                 \n    As of this Exception the following function(s) are waiting to run: {[f[1] for f in functions]} \
+                                 \n    And the currently processed requires look like this: "{requires}"')
+
+        # shunting-yard, ! binds tighter than & and |, which are evaluated left to right
+        prec = {"&": 2, "|": 2, "!": 3}
+        stack = []
+        postfix = []
+        try:
+            for token in tokens:
+                if isinstance(token, tuple):
+                    postfix.append(self.compile_operand(token, area, area_type, area_name, depth))
+                elif token in prec:
+                    while stack and stack[-1] != "(" and prec[token] <= prec[stack[-1]]:
+                        postfix.append(stack.pop())
+                    stack.append(token)
+                elif token == "(":
+                    stack.append(token)
+                elif token == ")":
+                    while stack and stack[-1] != "(":
+                        postfix.append(stack.pop())
+                    stack.pop()
+
+            while stack:
+                postfix.append(stack.pop())
+        except IndexError:
+            raise self.logic_error(area, area_type, area_name, LogicErrorSource.INFIX_TO_POSTFIX)
+
+        nodes = []
+        try:
+            for token in postfix:
+                if token == "&":
+                    right = nodes.pop()
+                    nodes.append(require_and(nodes.pop(), right))
+                elif token == "|":
+                    right = nodes.pop()
+                    nodes.append(require_or(nodes.pop(), right))
+                elif token == "!":
+                    nodes.append(require_not(nodes.pop()))
+                elif token != "(":
+                    nodes.append(token)
+        except IndexError:
+            raise self.logic_error(area, area_type, area_name, LogicErrorSource.EVALUATE_POSTFIX)
+
+        if len(nodes) != 1:
+            raise self.logic_error(area, area_type, area_name, LogicErrorSource.EVALUATE_STACK_SIZE)
+
+        return order_requires(nodes[0], self)
+
+    @staticmethod
+    def logic_error(area: dict, area_type: str, area_name: str, source: LogicErrorSource) -> KeyError:
+        return construct_logic_error({**area, "name": area_name, "is_region": area_type == "region"}, source)
+
+    def compile_operand(self, token: tuple, area: dict, area_type: str, area_name: str, depth: int) -> RequireNode:
+        if token[0] == "const":
+            return RequireConstant(token[1])
+
+        if token[0] == "function":
+            func_name = token[1]
+            func = globals().get(func_name)
+
+            if func is None:
+                func = getattr(Rules, func_name, None)
+
+            if not callable(func):
+                raise ValueError(f'Invalid function "{func_name}" in {area_type} "{area_name}".')
+
+            node = RequireFunction(func_name, func, token[2], area, area_type, area_name, depth)
+            if is_state_independent(func):
+                # its result cannot change during generation so it only needs to run once and get spliced in
+                return self.call_function(node, None)
+            return node
+
+        item = token[1]
+        require_type = 'category' if '|@' in item else 'item'
+        item = item.lstrip('|@$').rstrip('|')
+
+        item_parts = item.split(":")  # type: list[str]
+        item_name = item
+        item_count = "1"
+
+        if len(item_parts) > 1:
+            item_name = item_parts[0].strip()
+            item_count = item_parts[1].strip()
+
+        if require_type == 'category':
+            category_items = self.world.category_name_to_items.get(item_name, ())
+            try:
+                item_count = resolve_requires_count(item_count, self.category_total(item_name))
+            except ValueError as e:
+                raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
+
+            if not category_items: # an empty category is never considered as collected, even with a count of 0
+                return RequireConstant(False)
+            if item_count <= 0:
+                return RequireConstant(True)
+            if item_name in self.world.category_name_to_state_key:
+                key = self.world.category_name_to_state_key[item_name]
+                return RequireCategoryCount(item_name, key, item_count, self.state_slot(key))
+            return RequireCategory(item_name, category_items, item_count, tuple(self.state_slot(member) for member in category_items))
+
+        item_count = resolve_requires_count(item_count, self.items_counts.get(item_name, 0))
+        if item_count <= 0:
+            return RequireConstant(True)
+        slot = self.state_slot(item_name)
+        if slot is None:
+            return RequireStateItem(item_name, item_count, item_name)
+        return RequireItem(item_name, item_count, slot)
+
+    def compile_legacy(self, requires: list) -> RequireNode:
+        entries = []
+
+        for item in requires:
+            # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
+            if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
+                or_items = item
+
+                if isinstance(item, dict):
+                    or_items = item["or"]
+
+                or_entries = []
+                for or_item in or_items:
+                    or_item_parts = or_item.split(":")
+                    or_item_name = or_item
+                    or_item_count = 1
+
+                    if len(or_item_parts) > 1:
+                        or_item_name = or_item_parts[0]
+                        or_item_count = int(or_item_parts[1])
+
+                    or_entries.append((or_item_name, or_item_count))
+                entries.append(("or", tuple(or_entries)))
+            else:
+                item_parts = item.split(":")
+                item_name = item
+                item_count = 1
+
+                if len(item_parts) > 1:
+                    item_name = item_parts[0]
+                    item_count = int(item_parts[1])
+
+                entries.append(("item", item_name, item_count))
+
+        if not entries:
+            return RequireConstant(True)
+        return RequireLegacyList(tuple(entries))
+
+    def bind_function_args(self, node: RequireFunction) -> tuple[tuple, tuple[int, ...]]:
+        """Returns the arguments of a requires function call with everything but the state already filled in,
+        and where the state goes in them. It's worked out once for every function and arguments string."""
+        key = (node.func, node.args)
+        binding = self.function_bindings.get(key)
+        if binding is None:
+            func_args = node.args.split(",")
+            if func_args == ['']:
+                func_args.pop()
+
+            self.convert_function_args(state_placeholder, node.func, func_args, node.area_name)
+            state_positions = tuple(index for index, arg in enumerate(func_args) if arg is state_placeholder)
+            binding = (tuple(func_args), state_positions)
+            self.function_bindings[key] = binding
+        return binding
+
+    def call_function(self, node: RequireFunction, state: CollectionState) -> RequireNode:
+        """Run a requires function and return the compiled version of its result"""
+        func_args, state_positions = self.bind_function_args(node)
+        if state_positions:
+            func_args = list(func_args)
+            for index in state_positions:
+                func_args[index] = state
+
+        try:
+            result = node.func(*func_args)
+        except Exception as ex:
+            raise RuntimeError(f'A call to the function "{node.name}" in {node.area_type} "{node.area_name}"\'s requires raised an Exception. \
+                                \nUnless it was called by another function, it should look something like "{{{node.name}({node.args})}}" in {node.area_type}s.json. \
+                                \nFull error message: \
+                                \n\n{type(ex).__name__}: {ex}')
+
+        if isinstance(result, bool):
+            return RequireConstant(result)
+
+        return self.compile_result(str(result), node)
+
+    def compile_result(self, result: str, node: RequireFunction) -> RequireNode:
+        """Functions returning a requires string get it compiled once and reused for every later call that return the same string"""
+        key = (result, node.depth)
+        compiled = self.compiled_results.get(key)
+        if compiled is None:
+            compiled = self.compile_string(result, node.area, node.area_type, node.area_name, node.depth + 1)
+            self.compiled_results[key] = compiled
+        return compiled
+
+    def convert_function_args(self, state: CollectionState, func, args: list[str], areaName: str):
         parameters = inspect.signature(func).parameters
         knownParameters = [World, 'ManualWorld', MultiWorld, CollectionState]
         index = -1
@@ -350,14 +882,14 @@ def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
             index += 1
             if target_type in knownParameters:
                 if target_type in [World, 'ManualWorld']:
-                    args.insert(index, world)
+                    args.insert(index, self.world)
                 elif target_type == MultiWorld:
-                    args.insert(index, multiworld)
+                    args.insert(index, self.multiworld)
                 elif target_type == CollectionState:
                     args.insert(index, state)
                 continue
             if parameter.name.lower() == "player":
-                args.insert(index, player)
+                args.insert(index, self.player)
                 continue
 
             if index < len(args) and args[index] != "":
@@ -387,6 +919,108 @@ def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
 
             args[index] = value
 
+class CompiledRules(NamedTuple):
+    """The compiled requires of a player's entrances and locations and the state keys they read.\n
+    Players whose rules compile the same share it, so it's never modified once made."""
+    entrance_rules: tuple[tuple[str, RequireNode], ...]
+    """(entrance name, its compiled requires) of every entrance with a rule, in the order they're added"""
+    location_rules: dict[str, RequireNode]
+    location_dependents: dict[str, set[str]]
+    entrance_dependents: dict[str, set[str]]
+    locations_depending_on_anything: set[str]
+    entrances_depending_on_anything: set[str]
+
+def compile_rules(context: RequiresContext) -> CompiledRules:
+    world, multiworld, player = context.world, context.multiworld, context.player
+
+    compiled_regions: dict[str, RequireNode] = {}
+    def compileRegion(region_name: str) -> RequireNode:
+        if region_name not in compiled_regions:
+            compiled_regions[region_name] = context.compile(regionMap[region_name], "region", region_name)
+        return compiled_regions[region_name]
+
+    entrance_rules: list[tuple[str, RequireNode]] = []
+    def addCompiledRule(entrance_name: str, node: RequireNode):
+        if isinstance(node, RequireConstant) and node.value:
+            return # always accessible, no need to add a rule
+        entrance_rules.append((entrance_name, node))
+        context.index_rule(entrance_name, node, True)
+
+    used_location_names = set()
+    # Region access rules
+    for region in regionMap.keys():
+        used_location_names.update([l.name for l in multiworld.get_region(region, player).locations])
+        if region != "Menu":
+            for exitRegion in multiworld.get_region(region, player).entrances:
+                addCompiledRule(exitRegion.name, compileRegion(region))
+            entrance_rules_data = regionMap[region].get("entrance_requires", {})
+            for e in entrance_rules_data:
+                entrance_name = f'{e}To{region}'
+                entrance_node = context.compile({"requires": entrance_rules_data[e], "name": entrance_name, "is_region": True}, "region", entrance_name)
+                addCompiledRule(entrance_name, entrance_node)
+            exit_rules = regionMap[region].get("exit_requires", {})
+            for e in exit_rules:
+                exit_name = f'{region}To{e}'
+                exit_node = context.compile({"requires": exit_rules[e], "name": exit_name, "is_region": True}, "region", exit_name)
+                addCompiledRule(exit_name, exit_node)
+
+    # Location access rules
+    for location in world.location_table:
+        if location["name"] not in used_location_names:
+            continue
+
+        node = RequireConstant(True)  # No location region and no location requires? It's accessible.
+        if "requires" in location: # Location has requires, check them alongside the region requires
+            node = context.compile(location, "location", location.get("name", f"unknown with these parameters: {location}"))
+
+        if "region" in location: # check the location's region's requires too
+            region_node = compileRegion(location["region"])
+            if "requires" in location:
+                node = order_requires(require_and(node, region_node), context)
+            else:
+                node = region_node
+
+        context.location_rules[location["name"]] = node
+        if isinstance(node, RequireConstant) and node.value:
+            continue # locations are accessible by default
+        context.index_rule(location["name"], node, False)
+
+    return CompiledRules(tuple(entrance_rules), context.location_rules, context.location_dependents, context.entrance_dependents,
+                         context.locations_depending_on_anything, context.entrances_depending_on_anything)
+
+def get_rules_fingerprint(world: "ManualWorld") -> Optional[tuple]:
+    """What the compiled requires of a player depend on: its options, how its requires get compiled and its progression item counts.\n
+    None if they shouldn't be shared."""
+    options_fingerprint = get_options_fingerprint(world)
+    if options_fingerprint is None or world.location_table is not location_table:
+        return None
+    return (options_fingerprint, world.use_state_counts_array, world.rules_functions_maximum_recursion,
+            tuple(sorted(world.get_item_counts(only_progression=True).items())))
+
+def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
+    # every requires is compiled once here, the access rules then only have to read the state
+    context = RequiresContext(world, multiworld, player)
+    world.requires_context = context
+
+    # players with the same options and item counts get the same compiled requires, including what their state independent functions returned
+    compiled = get_shared("compiled_rules", get_rules_fingerprint(world), lambda: compile_rules(context))
+    context.location_rules = compiled.location_rules
+    context.location_dependents = compiled.location_dependents
+    context.entrance_dependents = compiled.entrance_dependents
+    context.locations_depending_on_anything = compiled.locations_depending_on_anything
+    context.entrances_depending_on_anything = compiled.entrances_depending_on_anything
+
+    for entrance_name, node in compiled.entrance_rules:
+        add_rule(world.get_entrance(entrance_name), CompiledRequires(context, node))
+
+    for location_name, node in compiled.location_rules.items():
+        if isinstance(node, RequireConstant) and node.value:
+            continue # locations are accessible by default
+        set_rule(multiworld.get_location(location_name, player), CompiledRequires(context, node))
+
+    # Victory requirement
+    multiworld.completion_condition[player] = lambda state: state.has("__Victory__", player)
+
 
 def ItemValue(state: CollectionState, player: int, valueCount: str):
     """When passed a string with this format: 'valueName:int',
@@ -401,6 +1035,8 @@ def ItemValue(state: CollectionState, player: int, valueCount: str):
     requested_count = int(args[1].strip())
     return state.has(value_name, player, requested_count)
 
+ItemValue.dependencies = lambda valueCount: (format_state_prog_items_key(ProgItemsCat.VALUE, valueCount.split(":")[0]),) # what the item index should look for
+
 
 # Two useful functions to make require work if an item is disabled instead of making it inaccessible
 def OptOne(world: "ManualWorld", item: str, items_counts: Optional[dict] = None):
@@ -430,9 +1066,8 @@ def OptOne(world: "ManualWorld", item: str, items_counts: Optional[dict] = None)
 
     if require_type == 'category':
         if item_count.isnumeric():
-            #Only loop if we can use the result to clamp
-            category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-            category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
+            #Only sum if we can use the result to clamp
+            category_items_counts = sum([items_counts.get(category_item, 0) for category_item in world.category_name_to_items.get(item_name, ())])
             item_count = clamp(int(item_count), 0, category_items_counts)
         return f"|@{item_name}:{item_count}|"
     elif require_type == 'item':
@@ -593,3 +1228,5 @@ def YamlCompare(world: "ManualWorld", multiworld: MultiWorld, state: CollectionS
 
     return not result if reverse_result else result
 
+YamlCompare.state_independent = True # the state argument is unused, it's only kept so existing calls don't break
+
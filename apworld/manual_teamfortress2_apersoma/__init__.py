@@ -1,7 +1,9 @@
 from base64 import b64encode
+import heapq
 import logging
 import os
 import json
+import time
 from typing import Callable, Optional, Counter
 import webbrowser
 
@@ -13,14 +15,17 @@ from .Data import item_table, location_table, region_table, category_table
 from .Game import game_name, filler_item_name, starting_items
 from .Meta import world_description, world_webworld, enable_region_diagram
 from .Locations import location_id_to_name, location_name_to_id, location_name_to_location, location_name_groups, victory_names
-from .Items import item_id_to_name, item_name_to_id, item_name_to_item, item_name_groups
+from .Items import item_id_to_name, item_name_to_id, item_name_to_item, item_name_groups, \
+    category_name_to_items, category_name_to_state_key, item_name_to_category_state_keys, item_name_to_state_keys, \
+    item_name_to_value_deltas
 from .DataValidation import runGenerationDataValidation, runPreFillDataValidation
 
 from .Regions import create_regions
 from .Items import ManualItem
-from .Rules import set_rules
+from .Rules import set_rules, update_state_counts
 from .Options import manual_options_data
-from .Helpers import is_item_enabled, get_option_value, get_items_for_player, resolve_yaml_option, format_state_prog_items_key, ProgItemsCat
+from .Helpers import is_item_enabled, get_option_value, get_items_for_player, resolve_yaml_option, \
+    EnablementTable, PlayerItems
 
 from BaseClasses import CollectionState, ItemClassification, Item
 from Options import PerGameCommonOptions
@@ -34,7 +39,7 @@ from .hooks.World import \
     before_generate_basic, after_generate_basic, \
     before_fill_slot_data, after_fill_slot_data, before_write_spoiler, \
     before_extend_hint_information, after_extend_hint_information, \
-    after_collect_item, after_remove_item
+    after_collect_item, after_remove_item, after_generation_step
 from .hooks.Data import hook_interpret_slot_data
 
 class ManualWorld(World):
@@ -55,6 +60,11 @@ class ManualWorld(World):
     item_name_to_id = item_name_to_id
     item_name_to_item = item_name_to_item
     item_name_groups = item_name_groups
+    category_name_to_items = category_name_to_items
+    category_name_to_state_key = category_name_to_state_key
+    item_name_to_category_state_keys = item_name_to_category_state_keys
+    item_name_to_state_keys = item_name_to_state_keys
+    item_name_to_value_deltas = item_name_to_value_deltas
 
     filler_item_name = filler_item_name
 
@@ -96,6 +106,8 @@ class ManualWorld(World):
     def create_regions(self):
         before_create_regions(self, self.multiworld, self.player)
 
+        # options can't change anymore, so from here on is_*_enabled only work each category/item/location out once
+        self.enablement = EnablementTable(self.multiworld, self.player)
         create_regions(self, self.multiworld, self.player)
 
         location_game_complete = self.multiworld.get_location(victory_names[get_option_value(self.multiworld, self.player, 'goal')], self.player)
@@ -121,9 +133,9 @@ class ManualWorld(World):
             if name == filler_item_name: continue # intentionally using the Game.py filler_item_name here because it's a non-Items item
 
             item = self.item_name_to_item[name]
-            item_count = int(item.get("count", 1))
+            item_count = item.count
 
-            if item.get("trap"):
+            if item.trap:
                 traps.append(name)
 
             if "category" in item:
@@ -239,6 +251,8 @@ class ManualWorld(World):
         # need to put all of the items in the pool so we can have a full state for placement
         # then will remove specific item placements below from the overall pool
         self.multiworld.itempool += pool
+        # from now on the player's items are looked up here instead of among every item of the multiworld
+        self.player_items = PlayerItems(self.multiworld, self.player, [*self.get_placed_items(), *pool])
 
         real_pool = pool + items_started
         self.item_counts[self.player] = self.get_item_counts(pool=real_pool)
@@ -251,18 +265,7 @@ class ManualWorld(World):
         if class_override is not None:
             classification = class_override
         else:
-            classification = ItemClassification.filler
-
-            if "trap" in item and item["trap"]:
-                classification |= ItemClassification.trap
-
-            if "useful" in item and item["useful"]:
-                classification |= ItemClassification.useful
-
-            if "progression_skip_balancing" in item and item["progression_skip_balancing"]:
-                classification |= ItemClassification.progression_skip_balancing
-            elif "progression" in item and item["progression"]:
-                classification |= ItemClassification.progression
+            classification = item.classification
 
         item_object = ManualItem(name, classification,
                         self.item_name_to_id[name], player=self.player)
@@ -274,20 +277,26 @@ class ManualWorld(World):
     # Item Value need a tweaked collect and remove:
     def collect(self, state: CollectionState, item: Item) -> bool:
         change = super().collect(state, item)
-        manual_item = self.item_name_to_item.get(item.name, {})
-        if change and manual_item.get("value"):
-            for key, value in manual_item["value"].items():
-                state.prog_items[item.player][format_state_prog_items_key(ProgItemsCat.VALUE, key)] += int(value)
+        if change:
+            for key, amount in self.item_name_to_value_deltas.get(item.name, ()):
+                state.prog_items[item.player][key] += amount
+            for key in self.item_name_to_category_state_keys.get(item.name, ()):
+                state.prog_items[item.player][key] += 1
         after_collect_item(self, state, change, item)
+        if change and self.use_state_counts_array:
+            update_state_counts(state, item.player, self.item_name_to_state_keys.get(item.name, ()))
         return change
 
     def remove(self, state: CollectionState, item: Item) -> bool:
         change = super().remove(state, item)
-        manual_item = self.item_name_to_item.get(item.name, {})
-        if change and manual_item.get("value"):
-            for key, value in manual_item["value"].items():
-                state.prog_items[item.player][format_state_prog_items_key(ProgItemsCat.VALUE, key)] -= int(value)
+        if change:
+            for key, amount in self.item_name_to_value_deltas.get(item.name, ()):
+                state.prog_items[item.player][key] -= amount
+            for key in self.item_name_to_category_state_keys.get(item.name, ()):
+                state.prog_items[item.player][key] -= 1
         after_remove_item(self, state, change, item)
+        if change and self.use_state_counts_array:
+            update_state_counts(state, item.player, self.item_name_to_state_keys.get(item.name, ()))
         return change
 
     def set_rules(self):
@@ -300,69 +309,84 @@ class ManualWorld(World):
     def generate_basic(self):
         before_generate_basic(self, self.multiworld, self.player)
 
+        def items_in_categories(categories: list[str]) -> set[str]:
+            return {item_name for category in categories for item_name in self.category_name_to_items.get(category, ())}
+
         # Handle item forbidding
         manual_locations_with_forbid = {location['name']: location for location in location_name_to_location.values() if "dont_place_item" in location or "dont_place_item_category" in location}
         locations_with_forbid = [l for l in self.multiworld.get_unfilled_locations(player=self.player) if l.name in manual_locations_with_forbid.keys()]
         for location in locations_with_forbid:
             manual_location = manual_locations_with_forbid[location.name]
-            forbidden_item_names = []
+            forbidden_item_names = set()
 
             if manual_location.get("dont_place_item"):
-                forbidden_item_names.extend([i["name"] for i in item_name_to_item.values() if i["name"] in manual_location["dont_place_item"]])
+                forbidden_item_names.update(name for name in manual_location["dont_place_item"] if name in item_name_to_item)
 
             if manual_location.get("dont_place_item_category"):
-                forbidden_item_names.extend([i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["dont_place_item_category"])])
+                forbidden_item_names.update(items_in_categories(manual_location["dont_place_item_category"]))
 
             if forbidden_item_names:
-                forbid_items_for_player(location, set(forbidden_item_names), self.player)
+                forbid_items_for_player(location, forbidden_item_names, self.player)
 
         # Handle specific item placements using fill_restrictive
         manual_locations_with_placements = {location['name']: location for location in location_name_to_location.values() if "place_item" in location or "place_item_category" in location}
         locations_with_placements = [l for l in self.multiworld.get_unfilled_locations(player=self.player) if l.name in manual_locations_with_placements.keys()]
+
+        # where each of the player's items is in the pool, so finding the eligible items doesn't need a scan of the whole pool
+        pool_positions: dict[str, list[int]] = {}
+        if locations_with_placements:
+            for position, item in enumerate(self.multiworld.itempool):
+                if item.player == self.player:
+                    pool_positions.setdefault(item.name, []).append(position)
+        placed_positions: set[int] = set()
+
         for location in locations_with_placements:
             manual_location = manual_locations_with_placements[location.name]
-            eligible_items = []
-            eligible_item_names = []
-            forbidden_item_names = []
+            eligible_positions = []
+            eligible_item_names = set()
+            forbidden_item_names = set()
             place_messages = []
             forbid_messages = []
 
             #First we get possible items names
             if manual_location.get("place_item"):
-                eligible_item_names += manual_location["place_item"]
+                eligible_item_names.update(manual_location["place_item"])
                 place_messages.append('", "'.join(manual_location["place_item"]))
 
             if manual_location.get("place_item_category"):
-                eligible_item_names += [i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["place_item_category"])]
+                eligible_item_names.update(items_in_categories(manual_location["place_item_category"]))
                 place_messages.append('", "'.join(manual_location["place_item_category"]) + " category(ies)")
 
             # Second we check for forbidden items names
             if manual_location.get("dont_place_item"):
-                forbidden_item_names += manual_location["dont_place_item"]
+                forbidden_item_names.update(manual_location["dont_place_item"])
                 forbid_messages.append('", "'.join(manual_location["dont_place_item"]) + ' items')
 
             if manual_location.get("dont_place_item_category"):
-                forbidden_item_names += [i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["dont_place_item_category"])]
+                forbidden_item_names.update(items_in_categories(manual_location["dont_place_item_category"]))
                 forbid_messages.append('", "'.join(manual_location["dont_place_item_category"]) + ' category(ies)')
 
             # If we forbid some names, check for those in the possible names and remove them
-            if forbidden_item_names:
-                eligible_item_names = [name for name in eligible_item_names if name not in forbidden_item_names]
+            eligible_item_names -= forbidden_item_names
 
             if eligible_item_names:
-                eligible_items = [item for item in self.multiworld.itempool if item.player == self.player and item.name in eligible_item_names]
+                # in pool order, like the pool itself would list them
+                eligible_positions = [position for position in heapq.merge(*(pool_positions.get(name, ()) for name in eligible_item_names))
+                                      if position not in placed_positions]
 
-            if len(eligible_items) == 0:
+            if len(eligible_positions) == 0:
                 nl = "\n"
                 if forbidden_item_names:
                     raise Exception(f'Could not find a suitable item to place at "{manual_location["name"]}".\n    No items that match "{f"{nl}     or ".join(place_messages)}"\n    Maybe because of forbidden "{f"{nl}     or ".join(forbid_messages)}"')
                 raise Exception(f'Could not find a suitable item to place at "{manual_location["name"]}". \n    No items that match "{f"{nl}     or ".join(place_messages)}"')
 
-            item_to_place = self.random.choice(eligible_items)
-            location.place_locked_item(item_to_place)
+            position_to_place = self.random.choice(eligible_positions)
+            location.place_locked_item(self.multiworld.itempool[position_to_place])
+            placed_positions.add(position_to_place)
 
-            # remove the item we're about to place from the pool so it isn't placed twice
-            self.multiworld.itempool.remove(item_to_place)
+        # remove the items we placed from the pool so they aren't placed twice, all at once
+        if placed_positions:
+            self.multiworld.itempool[:] = [item for position, item in enumerate(self.multiworld.itempool) if position not in placed_positions]
 
 
         after_generate_basic(self, self.multiworld, self.player)
@@ -373,6 +397,11 @@ class ManualWorld(World):
             visualize_regions(self.multiworld.get_region("Menu", self.player), f"{self.game}_{self.player}.puml")
 
     def pre_fill(self):
+        # AP takes the start_inventory_from_pool items out of the pool after generate_basic, they're already precollected,
+        # and item plando can have put some of the player's items at other players' locations
+        if self.player_items is not None:
+            self.player_items.sync([*self.get_placed_items(), *(item for item in self.multiworld.itempool if item.player == self.player)])
+
         # DataValidation after all the hooks are done but before fill
         runPreFillDataValidation(self, self.multiworld)
 
@@ -421,6 +450,24 @@ class ManualWorld(World):
     The maximum time a location/region's requirement can loop to check for functions\n
     One thing to remember is the more you loop the longer generation will take. So probably leave it as is unless you really needs it."""
 
+    enablement: Optional[EnablementTable] = None
+    """Whether the categories, items and locations are enabled for this player, set at the start of create_regions"""
+
+    player_items: Optional[PlayerItems] = None
+    """The items of this player in the pool or placed at a location, set at the end of create_items"""
+
+    share_between_players: bool = True
+    """Default: True\n
+    Players with the same values for this game's options share what gets worked out from them: the enabled locations, the goal tracking,
+    and when their progression item counts are also the same, the compiled requires with what their state independent functions returned.\n
+    Set this to False if a hook or a requires function can give different results to such players, like by using world.random or the player's name."""
+
+    use_state_counts_array: bool = True
+    """Default: True\n
+    Compiled requires read the item counts from an array kept next to state.prog_items instead of reading state.prog_items itself,
+    which lets several items needed together be checked in one go.\n
+    Only the collected item's own keys are kept in sync, so if an after_collect_item/after_remove_item hook changes the count of another item, set this to False."""
+
     def add_filler_items(self, item_pool, traps):
         Utils.deprecate("Use adjust_filler_items instead.")
         return self.adjust_filler_items(item_pool, traps)
@@ -429,6 +476,7 @@ class ManualWorld(World):
         extras = len(self.multiworld.get_unfilled_locations(player=self.player)) - len(item_pool)
 
         if extras > 0:
+            start = time.perf_counter()
             trap_percent = get_option_value(self.multiworld, self.player, "filler_traps")
             if not traps:
                 trap_percent = 0
@@ -443,40 +491,54 @@ class ManualWorld(World):
             for _ in range(0, filler_count):
                 extra_item = self.create_item(self.get_filler_item_name())
                 item_pool.append(extra_item)
+
+            after_generation_step("add_filler_items", time.perf_counter() - start,
+                                  {"missing": extras, "traps": trap_count, "filler": filler_count}, self, self.multiworld, self.player)
         elif extras < 0:
+            start = time.perf_counter()
             logging.warning(f"{self.game} has more items than locations. {abs(extras)} non-progression items will be removed at random.")
             # Filler is only assigned if the item doesn't have any other tags, so it only has to be covered by itself.
             # Skip Balancing is also not covered due to how it's only supported when paired with Progression.
             # As a result, these cover every possible combination can be removed.
-            fillers = [item for item in item_pool if item.classification == ItemClassification.filler]
-            traps = [item for item in item_pool if item.classification == ItemClassification.trap]
-            useful = [item for item in item_pool if item.classification == ItemClassification.useful]
+            fillers = []
+            traps = []
+            useful = []
             # Useful + Trap is classified separately so that it can have a unique priority ranking.
-            useful_traps = [item for item in item_pool if
-                            ItemClassification.progression not in item.classification
-                            and ItemClassification.useful in item.classification
-                            and ItemClassification.trap in item.classification]
+            useful_traps = []
+            for item in item_pool:
+                if item.classification == ItemClassification.filler:
+                    fillers.append(item)
+                elif item.classification == ItemClassification.trap:
+                    traps.append(item)
+                elif item.classification == ItemClassification.useful:
+                    useful.append(item)
+                elif ItemClassification.progression not in item.classification \
+                        and ItemClassification.useful in item.classification \
+                        and ItemClassification.trap in item.classification:
+                    useful_traps.append(item)
             self.random.shuffle(fillers)
             self.random.shuffle(traps)
             self.random.shuffle(useful)
             self.random.shuffle(useful_traps)
-            for _ in range(0, abs(extras)):
-                popped = None
-                if fillers:
-                    popped = fillers.pop()
-                elif traps:
-                    popped = traps.pop()
-                elif useful:
-                    popped = useful.pop()
-                elif useful_traps:
-                    popped = useful_traps.pop()
-                else:
-                    logging.warning("Could not remove enough non-progression items from the pool.")
-                    break
-                item_pool.remove(popped)
+
+            # fillers go first, then traps, useful and useful traps, each taken from the end of its shuffled list
+            removable = [*reversed(fillers), *reversed(traps), *reversed(useful), *reversed(useful_traps)]
+            removed = removable[:abs(extras)]
+            if len(removed) < abs(extras):
+                logging.warning("Could not remove enough non-progression items from the pool.")
+
+            removed_ids = {id(item) for item in removed}
+            item_pool[:] = [item for item in item_pool if id(item) not in removed_ids]
+
+            after_generation_step("remove_extra_items", time.perf_counter() - start,
+                                  {"extra": -extras, "removed": len(removed)}, self, self.multiworld, self.player)
 
         return item_pool
 
+    def get_placed_items(self) -> list[Item]:
+        """Returns the items of this player already placed at a location, theirs or another player's (eg. by item plando)"""
+        return [location.item for location in self.multiworld.get_filled_locations() if location.item.player == self.player]
+
     def get_item_counts(self, player: Optional[int] = None, pool: list[Item] | None | bool = None, only_progression: bool = False) -> Counter[str]:
         """Returns the player real item counts.\n
         If you provide an item pool using the pool argument, then it's item counts will be returned.
@@ -500,13 +562,24 @@ class ManualWorld(World):
             return self.item_counts.get(player, Counter())
 
 
+    def get_locations_affected_by(self, item_name: str) -> set[str]:
+        """Returns the names of the locations whose access could change when the item is collected or removed.\n
+        Only works after set_rules, it lets sweeps, trackers and validation recheck those instead of every location."""
+        return self.requires_context.affected_locations(item_name)
+
+    def evaluate_location_rules(self, state: CollectionState) -> dict[str, bool]:
+        """Returns whether the requires of each location are met in the state, all evaluated at once.\n
+        Only works after set_rules. It doesn't check if the location's region can be reached,
+        and rules added in hooks aren't part of it."""
+        return self.requires_context.evaluate_locations(state)
+
     def client_data(self):
         return {
             "game": self.game,
             'player_name': self.multiworld.get_player_name(self.player),
             'player_id': self.player,
-            'items': self.item_name_to_item,
-            'locations': self.location_name_to_location,
+            'items': {name: item.to_dict() for name, item in self.item_name_to_item.items()},
+            'locations': {name: location.to_dict() for name, location in self.location_name_to_location.items()},
             # todo: extract connections out of multiworld.get_regions() instead, in case hooks have modified the regions.
             'regions': region_table,
             'categories': category_table
@@ -1,3 +1,9 @@
+# The data files are loaded once, with the after_load hooks below, and then saved to a snapshot in Archipelago's cache folder
+# that later imports load instead, as long as the data files and the hooks haven't changed.
+# The generation validation is also skipped once it has passed for the current data.
+# Set this to False if your hooks depend on anything else, like options, other files or the internet.
+use_data_snapshot = True
+
 # called after the game.json file has been loaded
 def after_load_game_file(game_table: dict) -> dict:
     return game_table
@@ -1,10 +1,9 @@
 import logging
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, NamedTuple, Optional
 from worlds.AutoWorld import World
 from ..Helpers import clamp, get_items_with_value
-from BaseClasses import MultiWorld, CollectionState
+from BaseClasses import MultiWorld, CollectionState, Item
 
-# from RulesExtension import disabled_items
 
 import re
 
@@ -12,32 +11,12 @@ from worlds.generic.Rules import set_rule, add_rule
 from Options import Choice, Toggle, Range, NamedRange
 
 from ..Helpers import clamp, is_item_enabled, is_option_enabled, get_option_value, convert_string_to_type,\
-    format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat
+    format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat, get_options_fingerprint, get_shared
+from .RulesExtension import classes, get_options_snapshot
 
 if TYPE_CHECKING:
     from . import ManualWorld
 
-classes = ["Scout", "Soldier", "Pyro", "Demoman", "Heavy", "Engineer", "Medic", "Sniper", "Spy"]
-
-option_to_items: dict = {
-    "GrappleKill": ["Grappling Hook"],
-    "Mad Milk": ["Mad Milk"],
-    "BannerAssists": ["Buff Banner", "Concheror", "Battalion's Backup"],
-    "MantreadsKill": ["Mantreads"],
-    "ThermalThrusterKill": ["Thermal Thruster"],
-    "GasPasser": ["Gas Passer"],
-    "MediGunChecks": ["Medi Gun","Kritzkrieg","Quick-Fix","Vaccinator"],
-    "JarateAssist": ["Jarate"],
-    "SapperDestructions": ["Sapper","Red-Tape Recorder"]
-}
-
-def disabled_items(multiworld: MultiWorld, player: int) -> list[str]:
-    disabled: list[str] = []
-    for option in option_to_items:
-        if not is_option_enabled(multiworld, player, option):
-            disabled.extend(option_to_items[option])
-    return disabled
-
 # # Sometimes you have a requirement that is just too messy or repetitive to write out with boolean logic.
 # # Define a function here, and you can use it in a requires string with {function_name()}.
 # def overfishedAnywhere(world: World, state: CollectionState, player: int):
@@ -61,64 +40,115 @@ def disabled_items(multiworld: MultiWorld, player: int) -> list[str]:
 #     """Returns a requires string that checks if the player has unlocked the tank."""
 #     return "|Figher Level:15| or |Black Belt Level:15| or |Thief Level:15|"
 
+# # Functions that don't ask for a CollectionState (like requiresMelee above) are only called once per player, when the rules are set,
+# # and their result is reused for every check. If such a function relies on something that changes during generation,
+# # set requiresMelee.state_independent = False so it gets called on every check instead.
+
 if TYPE_CHECKING:
     from __init__ import ManualWorld
 
 
-# You can also pass an argument to your function, like {function_name(15)}
-# Note that all arguments are strings, so you'll need to convert them to ints if you want to do math.
-def GoalInLogic(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int):
-    possible_checks_by_class: dict = dict.fromkeys(classes, 0)
-    possible_checks_by_class["Engineer"] = 1 #bc of sentry gun
-    disabled: list[str] = disabled_items(multiworld, player)
-    stocksanity: bool = is_option_enabled(multiworld, player, "Stocksanity")
-    def has_item_for(name: str, location: dict):
-        return (
-            state.has(name, player) or
-            state.has(name.split(" (")[0], player) or
-            (stocksanity and "StockLocation" in location.get("category"))
-        )
+class GoalTracking(NamedTuple):
+    item_locations: dict[str, list[tuple[tuple[str, ...], tuple[tuple[str, int], ...]]]]
+    """item name -> (items that can make the location count, (goal key, checks added)) of each location it unlocks"""
+    thresholds: tuple[tuple[str, int], ...]
+    """(goal key, checks still needed once the always counted locations are taken out)"""
+    unlock_classes: bool
+
+def goal_checks_key(cla55: str) -> str:
+    return format_state_prog_items_key("GoalChecks", cla55)
+
+def start_goal_tracking(world: "ManualWorld", state: CollectionState):
+    """Build the goal tracking once the options are final, from before_create_regions,
+    and count in the items already collected into state, like the start_inventory AP pushes before create_regions"""
+    tracking = get_goal_tracking(world)
+    if state is None:
+        return
+    counts = state.prog_items[world.player]
+    for item_name, item_locations in tracking.item_locations.items():
+        if not counts[item_name]:
+            continue
+        for unlocked_by, weights in item_locations:
+            # only counted once, for the first of its items in the state
+            if next(other for other in unlocked_by if counts[other]) != item_name:
+                continue
+            for key, count in weights:
+                counts[key] += count
+
+def get_goal_tracking(world: "ManualWorld") -> GoalTracking:
+    """Build once per world what GoalInLogic needs, the counts themselves are kept in the state by track_goal_checks.\n
+    Only use it from create_regions on, start_goal_tracking is what builds it first."""
+    tracking = getattr(world, "goal_tracking", None)
+    if tracking is not None:
+        return tracking
+
+    # players with the same options get the same tracking
+    tracking = get_shared("goal_tracking", get_options_fingerprint(world), lambda: build_goal_tracking(world))
+    world.goal_tracking = tracking
+    return tracking
+
+def build_goal_tracking(world: "ManualWorld") -> GoalTracking:
+    options = get_options_snapshot(world)
+    always_counted: dict = dict.fromkeys(classes, 0)
+    always_counted["Engineer"] = 1 #bc of sentry gun
+    disabled: frozenset[str] = options.disabled_items
+    stocksanity: bool = options.is_enabled("Stocksanity")
+    item_locations: dict[str, list] = {}
     for location in world.location_table:
         name: str = location.get("name", "Something that shouldn't have any matches")
-        if location.get("victory", False) or name == "Grappling Hook":
+        if location.get("victory", False) or name == "Grappling Hook" or name in disabled:
+            continue
+        categories: list[str] = location.get("category", [])
+        checks: dict = dict.fromkeys(classes, 0)
+        for cla55 in world.class_of_location.get(name, ()):
+            checks[cla55] += 1
+        if not any(checks.values()):
             continue
-        if has_item_for(name, location) and not name in disabled:
-            for cat in location.get("category", []):
-                for cla55 in classes:
-                    if cla55 in cat:
-                        possible_checks_by_class[cla55] += 1
-        # raise Exception(f"""
-        #     name: {str(name)}
-        #     possible_checks_by_class: {str(possible_checks_by_class)}
-        #     disabled: {str(disabled)}
-        #     """)
-
-
-
-    # for item in world.item_table:
-    #     if item.get("category", [""])[0] == "Class Unlocks":
-    #         class_unlocked[item.get("name", "")] = True
-    #         continue
-    #
-    #     for key in classes:
-    #         for category in item.get("category", []):
-    #             if category.startswith(key) and item.get("progression", False):
-    #                 for location in world.location_table:
-    #                     if location.get("name", "").startswith(item.get("name", "-")):
-    #                         possible_checks_by_class[key] += 1
-    #                         break
-    # items = state.prog_items[player]
-    # raise Exception(f"""
-    # possible_checks_by_class: {str(possible_checks_by_class)}
-    # disabled: {str(disabled)}
-    # """)
-    unlock_classes: bool = is_option_enabled(multiworld, player, "UnlockClasses")
-    for cla55 in classes:
-        if (
-            possible_checks_by_class[cla55] < get_option_value(multiworld, player, cla55) or
-            (unlock_classes and not state.has(cla55, player))
-        ):
+        if stocksanity and "StockLocation" in categories:
+            for cla55, count in checks.items():
+                always_counted[cla55] += count
+            continue
+        unlocked_by = tuple({name, name.split(" (")[0]})
+        weights = tuple((goal_checks_key(cla55), count) for cla55, count in checks.items() if count)
+        for item_name in unlocked_by:
+            item_locations.setdefault(item_name, []).append((unlocked_by, weights))
+
+    thresholds = tuple(
+        (goal_checks_key(cla55), options.class_requirements[cla55] - always_counted[cla55])
+        for cla55 in classes
+    )
+    return GoalTracking(item_locations, thresholds, options.is_enabled("UnlockClasses"))
+
+def track_goal_checks(world: "ManualWorld", state: CollectionState, item: Item, collected: bool):
+    """Called from after_collect_item/after_remove_item, a location only counts once any of the items for it is in the state.\n
+    Items collected before start_goal_tracking (the start_inventory) are counted in by it instead."""
+    tracking = getattr(world, "goal_tracking", None)
+    if tracking is None:
+        return
+    item_locations = tracking.item_locations.get(item.name)
+    if not item_locations:
+        return
+    counts = state.prog_items[item.player]
+    if counts[item.name] != (1 if collected else 0):
+        return # only the first copy collected or the last one removed changes anything
+    sign = 1 if collected else -1
+    for unlocked_by, weights in item_locations:
+        if any(counts[other] for other in unlocked_by if other != item.name):
+            continue
+        for key, count in weights:
+            counts[key] += sign * count
+
+# You can also pass an argument to your function, like {function_name(15)}
+# Note that all arguments are strings, so you'll need to convert them to ints if you want to do math.
+def GoalInLogic(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int):
+    tracking = get_goal_tracking(world)
+    counts = state.prog_items[player]
+    for key, needed in tracking.thresholds:
+        if counts[key] < needed:
             return False
+    if tracking.unlock_classes:
+        for cla55 in classes:
+            if not state.has(cla55, player):
+                return False
 
     return True
-
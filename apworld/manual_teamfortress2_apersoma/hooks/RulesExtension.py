@@ -1,87 +1,124 @@
-
-from worlds.AutoWorld import World
-from BaseClasses import MultiWorld
-
-from ..Helpers import is_option_enabled
-
-option_to_items: dict = {
-    "GrappleKill": ["Grappling Hook"],
-    "Mad Milk": ["Mad Milk"],
-    "BannerAssists": ["Buff Banner", "Concheror", "Battalion's Backup"],
-    "MantreadsKill": ["Mantreads"],
-    "ThermalThrusterKill": ["Thermal Thruster"],
-    "GasPasser": ["Gas Passer"],
-    "MediGunChecks": ["Medi Gun","Kritzkrieg","Quick-Fix","Vaccinator"],
-    "JarateAssist": ["Jarate"],
-    "SapperDestructions": ["Sapper""Red-Tape Recorder"]
-}
-
-def disabled_items(multiworld: MultiWorld, player: int) -> list[str]:
-    disabled: list[str] = []
-    for option in option_to_items:
-        if not is_option_enabled(multiworld, player, option):
-            disabled.extend(option_to_items[option])
-    return disabled
-
-# from typing import TYPE_CHECKING, Optional
-# from enum import IntEnum
-# from operator import eq, ge, le
-#
-# from ..Regions import regionMap
-# import Rules
-# from ..Helpers import clamp, is_item_enabled, is_option_enabled, get_option_value, convert_string_to_type,\
-#     format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat
-#
-# from BaseClasses import MultiWorld, CollectionState
-# from worlds.AutoWorld import World
-# from worlds.generic.Rules import set_rule, add_rule
-# from Options import Choice, Toggle, Range, NamedRange
-#
-# import re
-# import math
-# import inspect
-# import logging
-#
-#
-# if TYPE_CHECKING:
-#     from . import ManualWorld
-#
-# classes = ["Scout", "Soldier", "Pyro", "Demoman", "Heavy", "Engineer", "Medic", "Sniper", "Spy"]
-#
-# # You can also pass an argument to your function, like {function_name(15)}
-# # Note that all arguments are strings, so you'll need to convert them to ints if you want to do math.
-# def GoalInLogic(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int):
-#     possible_checks_by_class = dict.fromkeys(classes, 3)
-#     possible_checks_by_class["Engineer"] = 4 #bc of sentry gun
-#     possible_checks_by_class["Spy"] = 2 #bc of sapper
-#
-#     class_unlocked = dict.fromkeys(classes, False)
-#     for item in world.item_table:
-#         main_category = item.get("category", [""])[0]
-#
-#         if main_category == "Class Unlocks":
-#             class_unlocked[item.get("name", "")] = True
-#             continue
-#
-#         for key in classes:
-#             if main_category.startswith(key) and item.get("progression", False):
-#                 possible_checks_by_class[key] += state.count(item.get("name", ""), player)
-#
-#     required_kills = get_required_kills(multiworld, player)
-#
-#     for key in classes:
-#         if possible_checks_by_class[key] < required_kills[key] or not class_unlocked[key]:
-#             return False
-#
-#     return True
-#
-# def get_required_kills(multiworld: MultiWorld, player: int):
-#     required_kills = dict.fromkeys(classes, 0)
-#     for key in classes:
-#         required_kills[key] = get_option_value(multiworld, player, "Required Kills")
-#     # required_kills = get_option_value(multiworld, player, "Required Kills")
-#     # if isinstance(required_kills, int):
-#     #     required_kills = dict.fromkeys(classes, required_kills)
-#     # elif "kills" in required_kills.keys():
-#     #     required_kills = dict.fromkeys(classes, required_kills["kills"])
-#     return required_kills
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from worlds.AutoWorld import World
+from BaseClasses import MultiWorld
+
+from ..Helpers import is_option_enabled, get_option_value, get_options_fingerprint, get_shared
+from ..Items import item_name_to_item
+from ..Locations import location_name_to_location
+
+classes = ("Scout", "Soldier", "Pyro", "Demoman", "Heavy", "Engineer", "Medic", "Sniper", "Spy")
+
+option_to_items: dict = {
+    "GrappleKill": ["Grappling Hook"],
+    "MadMilkAssist": ["Mad Milk"],
+    "BannerAssists": ["Buff Banner", "Concheror", "Battalion's Backup"],
+    "MantreadsKill": ["Mantreads"],
+    "ThermalThrusterKill": ["Thermal Thruster"],
+    "GasPasserKill": ["Gas Passer"],
+    "MediGunChecks": ["Medi Gun","Kritzkrieg","Quick-Fix","Vaccinator"],
+    "JarateAssist": ["Jarate"],
+    "SapperDestructions": ["Sapper", "Red-Tape Recorder"]
+}
+
+toggle_options = ("Stocksanity", "CrossClassWeapons", "UnlockGrapple", "UnlockClasses", *option_to_items)
+
+def classes_in_categories(categories) -> tuple[str, ...]:
+    """The classes mentioned by categories like "Scout (Primaries)" or "Scout Weapons", once for every category that mentions them"""
+    return tuple(cla55 for cat in categories for cla55 in classes if cla55 in cat)
+
+# item/location name -> classes_in_categories of its categories, worked out once here instead of matching category names over and over
+class_of_item: dict[str, tuple[str, ...]] = {name: classes_in_categories(item.get("category", [])) for name, item in item_name_to_item.items()}
+class_of_location: dict[str, tuple[str, ...]] = {name: classes_in_categories(location.get("category", [])) for name, location in location_name_to_location.items()}
+
+class OptionsSnapshot(NamedTuple):
+    """The options the hooks care about, read once per player so rules don't have to go through world.options"""
+    disabled_items: frozenset[str]
+    class_requirements: Mapping[str, int]
+    """class -> how many of its checks are needed to goal"""
+    enabled_toggles: frozenset[str]
+
+    def is_enabled(self, option: str) -> bool:
+        return option in self.enabled_toggles
+
+def get_options_snapshot(world: World) -> OptionsSnapshot:
+    snapshot = getattr(world, "options_snapshot", None)
+    if snapshot is not None:
+        return snapshot
+
+    multiworld, player = world.multiworld, world.player
+    def build() -> OptionsSnapshot:
+        enabled = frozenset(option for option in toggle_options if is_option_enabled(multiworld, player, option))
+        disabled = frozenset(item for option, items in option_to_items.items() if option not in enabled for item in items)
+        class_requirements = MappingProxyType({cla55: get_option_value(multiworld, player, cla55) for cla55 in classes})
+        return OptionsSnapshot(disabled, class_requirements, enabled)
+
+    snapshot = get_shared("options_snapshot", get_options_fingerprint(world), build)
+    world.options_snapshot = snapshot
+    return snapshot
+
+def disabled_items(multiworld: MultiWorld, player: int) -> frozenset[str]:
+    return get_options_snapshot(multiworld.worlds[player]).disabled_items
+
+# from typing import TYPE_CHECKING, Optional
+# from enum import IntEnum
+# from operator import eq, ge, le
+#
+# from ..Regions import regionMap
+# import Rules
+# from ..Helpers import clamp, is_item_enabled, is_option_enabled, get_option_value, convert_string_to_type,\
+#     format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat
+#
+# from BaseClasses import MultiWorld, CollectionState
+# from worlds.AutoWorld import World
+# from worlds.generic.Rules import set_rule, add_rule
+# from Options import Choice, Toggle, Range, NamedRange
+#
+# import re
+# import math
+# import inspect
+# import logging
+#
+#
+# if TYPE_CHECKING:
+#     from . import ManualWorld
+#
+#
+# # You can also pass an argument to your function, like {function_name(15)}
+# # Note that all arguments are strings, so you'll need to convert them to ints if you want to do math.
+# def GoalInLogic(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int):
+#     possible_checks_by_class = dict.fromkeys(classes, 3)
+#     possible_checks_by_class["Engineer"] = 4 #bc of sentry gun
+#     possible_checks_by_class["Spy"] = 2 #bc of sapper
+#
+#     class_unlocked = dict.fromkeys(classes, False)
+#     for item in world.item_table:
+#         main_category = item.get("category", [""])[0]
+#
+#         if main_category == "Class Unlocks":
+#             class_unlocked[item.get("name", "")] = True
+#             continue
+#
+#         for key in classes:
+#             if main_category.startswith(key) and item.get("progression", False):
+#                 possible_checks_by_class[key] += state.count(item.get("name", ""), player)
+#
+#     required_kills = get_required_kills(multiworld, player)
+#
+#     for key in classes:
+#         if possible_checks_by_class[key] < required_kills[key] or not class_unlocked[key]:
+#             return False
+#
+#     return True
+#
+# def get_required_kills(multiworld: MultiWorld, player: int):
+#     required_kills = dict.fromkeys(classes, 0)
+#     for key in classes:
+#         required_kills[key] = get_option_value(multiworld, player, "Required Kills")
+#     # required_kills = get_option_value(multiworld, player, "Required Kills")
+#     # if isinstance(required_kills, int):
+#     #     required_kills = dict.fromkeys(classes, required_kills)
+#     # elif "kills" in required_kills.keys():
+#     #     required_kills = dict.fromkeys(classes, required_kills["kills"])
+#     return required_kills
@@ -1,12 +1,11 @@
 # Object classes from AP core, to represent an entire MultiWorld and this individual World that's part of it
-import random
-from collections.abc import Sequence
+from collections.abc import Iterable
 
 from worlds.AutoWorld import World
 from BaseClasses import MultiWorld, CollectionState, Item, ItemClassification
 
 # Object classes from Manual -- extending AP core -- representing items and locations that are used in generation
-from ..Items import ManualItem
+from ..Items import ManualItem, item_name_to_item
 from ..Locations import ManualLocation
 from ..Helpers import clamp, is_item_enabled, is_option_enabled, get_option_value, convert_string_to_type,\
     format_to_valid_identifier, format_state_prog_items_key, ProgItemsCat
@@ -18,30 +17,12 @@ from ..Data import game_table, item_table, location_table, region_table
 # These helper methods allow you to determine if an option has been set, or what its value is, for any player in the multiworld
 from ..Helpers import is_option_enabled, get_option_value, format_state_prog_items_key, ProgItemsCat
 
+from .Rules import start_goal_tracking, track_goal_checks
+from .RulesExtension import classes, class_of_item, class_of_location, disabled_items, get_options_snapshot
+
 # calling logging.info("message") anywhere below in this file will output the message to both console and log file
 import logging
 
-option_to_items: dict = {
-    "GrappleKill": ["Grappling Hook"],
-    "MadMilkAssist": ["Mad Milk"],
-    "BannerAssists": ["Buff Banner", "Concheror", "Battalion's Backup"],
-    "MantreadsKill": ["Mantreads"],
-    "ThermalThrusterKill": ["Thermal Thruster"],
-    "GasPasser": ["Gas Passer"],
-    "MediGunChecks": ["Medi Gun","Kritzkrieg","Quick-Fix","Vaccinator"],
-    "JarateAssist": ["Jarate"],
-    "SapperDestructions": ["Sapper""Red-Tape Recorder"]
-}
-
-classes = ("Scout", "Soldier", "Pyro", "Demoman", "Heavy", "Engineer", "Medic", "Sniper", "Spy")
-
-def disabled_items(multiworld: MultiWorld, player: int) -> list[str]:
-    disabled: list[str] = []
-    for option in option_to_items:
-        if not is_option_enabled(multiworld, player, option):
-            disabled.extend(option_to_items[option])
-    return disabled
-
 def get_name(item) -> str:
     if isinstance(item, str):
         return item
@@ -51,9 +32,9 @@ def get_name(item) -> str:
 def to_table_item(item) -> dict:
     name: str = get_name(item)
 
-    for tbl_item in item_table:
-        if tbl_item.name == name:
-            return tbl_item
+    tbl_item = item_name_to_item.get(name)
+    if tbl_item is not None:
+        return tbl_item
 
     raise Exception(f"Could not find an item with the name: \"{name}\". Parameter 'item' was {item}.")
 
@@ -72,50 +53,55 @@ def to_items(items: list, item_pool: list, player: int) -> list:
         out.append(to_item(item, item_pool, player))
     return out
 
-def get_category(item) -> list[str]:
-    if hasattr(item, "category"):
-        category = getattr(item, "category")
-        if isinstance(category, list) and (len(category) == 0 or isinstance(category[0], str)):
-            return category
-    return to_table_item(item).get("category", [])
-
-class ItemsByCategorySubstring(dict):
-    def __init__(
-            self,
-            item_pool: list,
-            keys: Sequence[str] = classes,
-            convert_to_table_items: bool = False,
-            convert_to_item_names: bool = False,
-            convert_to_item_table_item_tuple: bool = False,
-            item_is_not_key: bool = False,
-            player: int | None = None
-    ):
-        dict.__init__(dict.fromkeys(classes, []))
-
-        def add(key: str, item):
-            if convert_to_table_items:
-                self[key].append(to_table_item(item))
-            elif convert_to_item_names:
-                self[key].append(get_name(item))
-            elif convert_to_item_table_item_tuple:
-                self[key].append((item, to_table_item(item)))
-            else:
-                self[key].append(item)
-
-
-        for item in item_pool:
-            if player is not None and item.player != player:
+class StartingItemPicker:
+    """Draws the starting classes and items of a player out of their item pool.\n
+    What can be drawn for each class and which items are progression is indexed once from the item categories,
+    and everything is drawn with world.random so a slot gets the same items for the same seed, whatever else generates in the process."""
+
+    def __init__(self, world: World, item_pool: list, player: int):
+        self.random = world.random
+        self.items: list[Item] = [item for item in item_pool if item.player == player]
+        self.drawn: dict[int, None] = {} # positions in items, in the order they were drawn
+        self.class_unlocks: dict[str, list[int]] = {}
+        self.class_members: dict[str, list[int]] = {cla55: [] for cla55 in classes}
+        self.progression: dict[int, None] = {}
+        self.drawable: list[int] = [] # everything but the class unlocks, for the random items
+
+        for position, item in enumerate(self.items):
+            # the classes themselves are given by their own count, never as one of the weapons or random items
+            if item.name in classes:
+                self.class_unlocks.setdefault(item.name, []).append(position)
                 continue
-            if item_is_not_key and get_name(item) in keys:
+            if "Class Unlocks" in to_table_item(item).get("category", []):
                 continue
-            for cat in get_category(item):
-                for key in keys:
-                    if key in cat:
-                        add(key, item)
+            self.drawable.append(position)
+
+            if item.classification & ItemClassification.progression:
+                self.progression[position] = None
 
+            for cla55 in dict.fromkeys(world.class_of_item.get(item.name, ())):
+                self.class_members[cla55].append(position)
 
+    def take(self, positions: Iterable[int]):
+        """Give these items for sure"""
+        self.drawn.update(dict.fromkeys(positions))
 
+    def draw(self, candidates: Iterable[int], count: int):
+        """Give up to count of the candidates that weren't given yet, picked at random"""
+        if count <= 0:
+            return
+        available = [position for position in candidates if position not in self.drawn]
+        self.take(self.random.sample(available, min(count, len(available))))
+
+    def give(self, multiworld: MultiWorld, item_pool: list) -> list:
+        """Make everything drawn starting items and take them out of the pool in one go"""
+        drawn_items = [self.items[position] for position in self.drawn]
+        for item in drawn_items:
+            multiworld.push_precollected(item)
 
+        drawn_ids = {id(item) for item in drawn_items}
+        item_pool[:] = [item for item in item_pool if id(item) not in drawn_ids]
+        return item_pool
 
 
 
@@ -140,7 +126,13 @@ def hook_get_filler_item_name(world: World, multiworld: MultiWorld, player: int)
 
 # Called before regions and locations are created. Not clear why you'd want this, but it's here. Victory location is included, but Victory event is not placed yet.
 def before_create_regions(world: World, multiworld: MultiWorld, player: int):
-    pass
+    # options are final by now, so this is where their snapshot and the goal tracking built from it get taken,
+    # anything that needs them before create_regions (like the start_inventory being collected) waits for this
+    # the TF2 classes mentioned by the categories of each item and location, for the goal tracking and the starting items
+    world.class_of_item = class_of_item
+    world.class_of_location = class_of_location
+    get_options_snapshot(world)
+    start_goal_tracking(world, multiworld.state)
 
 # Called after regions and locations are created, in case you want to see or modify that information. Victory location is included.
 def after_create_regions(world: World, multiworld: MultiWorld, player: int):
@@ -168,7 +160,7 @@ def before_create_items_all(item_config: dict[str, int|dict], world: World, mult
 
 # The item pool before starting items are processed, in case you want to see the raw item pool at that stage
 def before_create_items_starting(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
-    mark_non_progression: list[str] = disabled_items(multiworld, player)
+    mark_non_progression: frozenset[str] = disabled_items(multiworld, player)
 
     for item in item_pool:
         if item.player != player:
@@ -181,12 +173,6 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
             else:
                 item.classification = ItemClassification.useful
 
-    local_items: list[tuple] = list()
-    for item in item_pool:
-        if item.player == player:
-            local_items.append((item, to_table_item(item)))
-
-
     class_count = get_option_value(multiworld, player, "StartingClassCount")
     class_weapon_count = get_option_value(multiworld, player, "StartingClassWeaponCount")
     class_item_count = get_option_value(multiworld, player, "StartingClassItemCount")
@@ -196,77 +182,17 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
     if class_count == 0:
         return item_pool
 
-    starting_classes = list(classes)
-    random.seed(multiworld.seed)
-    random.shuffle(starting_classes)
-    starting_classes = starting_classes[:class_count]
-
-    class_weapons = list()
-    class_items = list()
-    weapons = list()
-
-    for item, tbl_item in local_items:
-        if item.name in starting_classes:
-            multiworld.push_precollected(item)
-            item_pool.remove(item)
-        else:
-            category = tbl_item.get("category", [])
-            if "Class Unlock" in category:
-                continue
-
-
-            weapon: bool = bool(item.classification & ItemClassification.progression)
-
-            if weapon and weapon_count:
-                weapons.append(item)
-
-            for cat in category:
-                for starting_class in starting_classes:
-                    if starting_class in cat:
-                        if class_item_count:
-                            class_items.append(item)
-                        if class_weapon_count and weapon:
-                            class_weapons.append(item)
-                        break
-                else:
-                    continue
-                break
-
-    if class_weapon_count:
-        random.shuffle(class_weapons)
-        for item in class_weapons[:class_weapon_count]:
-            multiworld.push_precollected(item)
-            item_pool.remove(item)
-            local_items.remove(item)
-            class_items.remove(item)
-            weapons.remove(item)
-
-    if class_item_count:
-        random.shuffle(class_items)
-        for item in class_items[:class_item_count]:
-            multiworld.push_precollected(item)
-            item_pool.remove(item)
-            local_items.remove(item)
-            try:
-                weapons.remove(item)
-            except ValueError:
-                continue
-
-    if weapon_count:
-        random.shuffle(weapons)
-        for item in weapons[:weapon_count]:
-            multiworld.push_precollected(item)
-            item_pool.remove(item)
-            local_items.remove(item)
+    picker = StartingItemPicker(world, item_pool, player)
+    starting_classes = world.random.sample(classes, min(class_count, len(classes)))
+    picker.take(position for cla55 in starting_classes for position in picker.class_unlocks.get(cla55, ()))
 
-    if item_count:
-        random.shuffle(local_items)
-        for item in local_items[:item_count]:
-            multiworld.push_precollected(item)
-            item_pool.remove(item)
-            local_items.remove(item)
+    class_positions = sorted({position for cla55 in starting_classes for position in picker.class_members[cla55]})
+    picker.draw([position for position in class_positions if position in picker.progression], class_weapon_count)
+    picker.draw(class_positions, class_item_count)
+    picker.draw(picker.progression, weapon_count)
+    picker.draw(picker.drawable, item_count)
 
-    return item_pool
+    return picker.give(multiworld, item_pool)
 
 # The item pool after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
 def before_create_items_filler(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
@@ -293,24 +219,10 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
     # location.place_locked_item(item_to_place)
     # item_pool.remove(item_to_place)
 
-# option_to_items: dict = {
-#     "GrappleKill": ["Grappling Hook"],
-#     "Mad Milk": ["Mad Milk"],
-#     "BannerAssists": ["Buff Banner", "Concheror", "Battalion's Backup"],
-#     "MantreadsKill": ["Mantreads"],
-#     "ThermalThrusterKill": ["Thermal Thruster"],
-#     "GasPasser": ["Gas Passer"],
-#     "MediGunChecks": ["Medi Gun","Kritzkrieg","Quick-Fix","Vaccinator"],
-#     "JarateAssist": ["Jarate"],
-#     "SapperDestructions": ["Sapper""Red-Tape Recorder"]
-# }
-#
-# def disabled_items(multiworld: MultiWorld, player: int) -> list[str]:
-#     disabled: list[str] = []
-#     for option in option_to_items:
-#         if not is_option_enabled(multiworld, player, option):
-#             disabled.extend(option_to_items[option])
-#     return disabled
+# Called with how long a step of generation took for this player, in seconds, and some numbers about what it did.
+# Currently reported: "add_filler_items" and "remove_extra_items" from adjust_filler_items
+def after_generation_step(step: str, seconds: float, details: dict, world: World, multiworld: MultiWorld, player: int):
+    logging.debug(f"{world.game} {step} for player {player} took {seconds:.4f}s: {details}")
 
 # The complete item pool prior to being set for generation is provided here, in case you want to make changes to it
 def after_create_items(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
@@ -376,7 +288,8 @@ def after_collect_item(world: World, state: CollectionState, Changed: bool, item
     # the following let you add to the Potato Item Value count
     # if item.name == "Cooked Potato":
     #     state.prog_items[item.player][format_state_prog_items_key(ProgItemsCat.VALUE, "Potato")] += 1
-    pass
+    if Changed:
+        track_goal_checks(world, state, item, True)
 
 # This method is run every time an item is removed from the state, can be used to modify the value of an item.
 # IMPORTANT! Any changes made in this hook must be first done in after_collect_item
@@ -384,7 +297,8 @@ def after_remove_item(world: World, state: CollectionState, Changed: bool, item:
     # the following let you undo the addition to the Potato Item Value count
     # if item.name == "Cooked Potato":
     #     state.prog_items[item.player][format_state_prog_items_key(ProgItemsCat.VALUE, "Potato")] -= 1
-    pass
+    if Changed:
+        track_goal_checks(world, state, item, False)
 
 
 # This is called before slot data is set and provides an empty dict ({}), in case you want to modify it before Manual does